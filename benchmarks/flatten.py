@@ -0,0 +1,80 @@
+"""Compare the speed of flattening and unflattening PyTree node types.
+
+Times `jax.tree.flatten`, `jax.tree.unflatten` and `jax.tree_util.tree_flatten_with_path`
+on a PyTree made of many small nodes of each type: the builtin containers, a
+`namedtuple`, an `eqx.Module`, and the classes made by `make_named_tuple_subclass`,
+`make_named_dict_subclass` and `make_record_class`.
+
+Usage:
+
+    python benchmarks/flatten.py [--n-nodes 10000] [--n-fields 4] [--repeats 5]
+"""
+
+import argparse
+from collections import namedtuple
+import timeit
+
+import equinox as eqx
+import jax.tree as jt
+import jax.tree_util as jtu
+
+from jax_cookbook import (
+    make_named_dict_subclass,
+    make_named_tuple_subclass,
+    make_record_class,
+)
+
+
+def node_factories(fields: tuple[str, ...]) -> dict:
+    NamedTuple = namedtuple("NamedTuple", fields)
+    Module = type(
+        "Module", (eqx.Module,), dict(__annotations__={field: int for field in fields})
+    )
+    NamedTupleSubclass = make_named_tuple_subclass("NamedTupleSubclass")
+    NamedDictSubclass = make_named_dict_subclass("NamedDictSubclass")
+    Record = make_record_class("Record", fields)
+
+    return {
+        "tuple": lambda values: tuple(values),
+        "dict": lambda values: dict(zip(fields, values)),
+        "namedtuple": lambda values: NamedTuple(*values),
+        "eqx.Module": lambda values: Module(*values),
+        "make_named_tuple_subclass": lambda values: NamedTupleSubclass(values),
+        "make_named_dict_subclass": lambda values: NamedDictSubclass(zip(fields, values)),
+        "make_record_class": lambda values: Record(*values),
+    }
+
+
+def best_time(func, repeats: int) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-nodes", type=int, default=10_000)
+    parser.add_argument("--n-fields", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    fields = tuple(f"f{i}" for i in range(args.n_fields))
+    values = tuple(range(args.n_fields))
+
+    print(
+        f"{args.n_nodes} nodes of {args.n_fields} fields; best of {args.repeats} "
+        f"(ms)\n"
+    )
+    print(f"{'node type':<28}{'flatten':>10}{'unflatten':>12}{'with path':>12}")
+    for name, make_node in node_factories(fields).items():
+        tree = [make_node(values) for _ in range(args.n_nodes)]
+        leaves, treedef = jt.flatten(tree)
+        t_flatten = best_time(lambda: jt.flatten(tree), args.repeats)
+        t_unflatten = best_time(lambda: jt.unflatten(treedef, leaves), args.repeats)
+        t_path = best_time(lambda: jtu.tree_flatten_with_path(tree), args.repeats)
+        print(
+            f"{name:<28}{1e3 * t_flatten:>10.2f}{1e3 * t_unflatten:>12.2f}"
+            f"{1e3 * t_path:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
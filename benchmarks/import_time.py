@@ -0,0 +1,75 @@
+"""Guard against regressions in the time it takes to `import jax_cookbook`.
+
+Runs `python -X importtime -c "import jax_cookbook"` in a fresh interpreter, parses
+the per-module timings it writes to stderr, and exits with a non-zero status if the
+cumulative import time exceeds a budget, or if any of the heavy dependencies are
+imported eagerly.
+
+Usage:
+
+    python benchmarks/import_time.py [--budget-ms 50] [--repeats 5]
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+
+
+# Packages that should only be imported once a cookbook function is first used.
+HEAVY_MODULES = ("jax", "jaxlib", "equinox", "jaxtyping", "numpy", "tqdm")
+
+_IMPORTTIME_LINE = re.compile(
+    r"import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|(?P<indent>\s*)(?P<name>\S+)"
+)
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Return the cumulative import time of each module, in microseconds."""
+    times = {}
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match is not None:
+            times[match["name"]] = int(match["cumulative"])
+    return times
+
+
+def measure(module: str) -> dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="jax_cookbook")
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeats)]
+    best_ms = min(run[args.module] for run in runs) / 1000
+    print(f"`import {args.module}`: {best_ms:.1f} ms (best of {args.repeats})")
+
+    failed = False
+    eager = sorted(
+        name for name in runs[0]
+        if name.split(".")[0] in HEAVY_MODULES
+    )
+    if eager:
+        top_level = sorted({name.split(".")[0] for name in eager})
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(top_level)}")
+        failed = True
+    if best_ms > args.budget_ms:
+        print(f"FAIL: import time exceeds the budget of {args.budget_ms:.1f} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
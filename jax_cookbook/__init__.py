@@ -4,62 +4,295 @@
 :license: Apache 2.0, see LICENSE for details.
 """
 
-from typing import Any
-
-from equinox import Module
-
-from ._tree import (
-    get_ensemble,
-    random_split_like_tree,
-    filter_wrap,
-    leaves_of_type,
-    make_named_dict_subclass,
-    make_named_tuple_subclass,
-    move_level_to_outside,
-    tree_array_bytes,
-    tree_call,
-    tree_concatenate,
-    tree_infer_batch_size,
-    tree_index,
-    tree_key_tuples,
-    tree_labels,
-    tree_labels_of_equal_leaves,
-    tree_map_tqdm,
-    tree_map_unzip,
-    tree_prefix_expand,
-    tree_set,
-    tree_set_scalar,
-    tree_stack,
-    tree_struct_bytes,
-    tree_take,
-    tree_take_multi,
-    tree_unstack,
-    tree_unzip,
-    tree_zip,
-)
-
-from ._vmap import (
-    unkwarg_key,
-    vmap_multi, 
-)
-
-from ._func import (
-    allf,
-    anyf,
-    compose,
-    notf,
-    idf,
-    is_not_type,
-    is_type,
-    
-)
-
-from ._where import (
-    where_attr_strs_to_func,
-    where_func_to_strs,
-)
-
-from ._types import (
-    is_module,
-    is_none,
-)
\ No newline at end of file
+import importlib
+from typing import TYPE_CHECKING
+
+
+# Maps each module to the public names it defines. To keep `import jax_cookbook`
+# cheap, a module (and JAX, Equinox, etc. along with it) is only imported when one
+# of its names is first accessed.
+_EXPORTS = {
+    "equinox": ("Module",),
+    "._tree": (
+        "get_ensemble",
+        "random_split_like_tree",
+        "filter_wrap",
+        "leaves_of_type",
+        "make_named_dict_subclass",
+        "make_named_tuple_subclass",
+        "make_record_class",
+        "move_level_to_outside",
+        "tree_array_bytes",
+        "tree_call",
+        "tree_combine_multi",
+        "tree_concatenate",
+        "tree_infer_batch_size",
+        "tree_key_tuples",
+        "tree_labels",
+        "tree_labels_of_equal_leaves",
+        "tree_map_stream",
+        "tree_map_tqdm",
+        "tree_map_unzip",
+        "tree_map_vectorized",
+        "tree_partition_multi",
+        "tree_prefix_expand",
+        "tree_reduce_stats",
+        "tree_set",
+        "tree_set_scalar",
+        "tree_stack",
+        "tree_struct_bytes",
+        "tree_take",
+        "tree_take_multi",
+        "tree_unstack",
+        "tree_unzip",
+        "tree_zip",
+    ),
+    "._async": (
+        "run_tree_map_async",
+        "tree_map_async",
+    ),
+    "._batch": (
+        "TreeBatchIterator",
+    ),
+    "._checkpoint": (
+        "DeltaCheckpointer",
+    ),
+    "._compress": (
+        "CompressedTree",
+        "CompressionStats",
+    ),
+    "._diff": (
+        "TreeDiffRecord",
+        "format_tree_diff",
+        "print_tree_diff",
+        "tree_diff",
+    ),
+    "._hash": (
+        "TreeDedupeInfo",
+        "tree_dedupe",
+        "tree_fingerprint",
+        "tree_memoize",
+    ),
+    "._index": (
+        "TreeIndex",
+    ),
+    "._memory": (
+        "MemoryPlan",
+        "plan_memory",
+        "recommend_chunk_size",
+    ),
+    "._packed": (
+        "PackedTree",
+        "tree_pack",
+        "tree_unpack",
+    ),
+    "._pipeline": (
+        "TreePipeline",
+    ),
+    "._print": (
+        "print_tree_summary",
+        "print_trees_side_by_side",
+        "tree_summary_lines",
+    ),
+    "._progress": (
+        "loop_tqdm",
+        "scan_tqdm",
+    ),
+    "._sharding": (
+        "tree_gather",
+        "tree_shard",
+    ),
+    "._shm": (
+        "SharedTree",
+        "SharedTreeHandle",
+        "tree_to_shared",
+    ),
+    "._transfer": (
+        "HostTreeFuture",
+        "tree_to_host",
+    ),
+    "._vmap": (
+        "unkwarg_key",
+        "vmap_multi",
+    ),
+    "._func": (
+        "allf",
+        "anyf",
+        "compose",
+        "notf",
+        "idf",
+        "is_not_type",
+        "is_type",
+    ),
+    "._where": (
+        "where_attr_strs_to_func",
+        "where_func_to_strs",
+    ),
+    "._types": (
+        "is_module",
+        "is_none",
+    ),
+}
+
+_MODULE_OF_NAME = {
+    name: module for module, names in _EXPORTS.items() for name in names
+}
+
+__all__ = list(_MODULE_OF_NAME)
+
+
+def __getattr__(name: str):
+    module_name = _MODULE_OF_NAME.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(module_name, __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if TYPE_CHECKING:
+    from equinox import Module
+
+    from ._tree import (
+        get_ensemble,
+        random_split_like_tree,
+        filter_wrap,
+        leaves_of_type,
+        make_named_dict_subclass,
+        make_named_tuple_subclass,
+        make_record_class,
+        move_level_to_outside,
+        tree_array_bytes,
+        tree_call,
+        tree_combine_multi,
+        tree_concatenate,
+        tree_infer_batch_size,
+        tree_key_tuples,
+        tree_labels,
+        tree_labels_of_equal_leaves,
+        tree_map_stream,
+        tree_map_tqdm,
+        tree_map_unzip,
+        tree_map_vectorized,
+        tree_partition_multi,
+        tree_prefix_expand,
+        tree_reduce_stats,
+        tree_set,
+        tree_set_scalar,
+        tree_stack,
+        tree_struct_bytes,
+        tree_take,
+        tree_take_multi,
+        tree_unstack,
+        tree_unzip,
+        tree_zip,
+    )
+
+    from ._async import (
+        run_tree_map_async,
+        tree_map_async,
+    )
+
+    from ._batch import (
+        TreeBatchIterator,
+    )
+
+    from ._checkpoint import (
+        DeltaCheckpointer,
+    )
+
+    from ._compress import (
+        CompressedTree,
+        CompressionStats,
+    )
+
+    from ._diff import (
+        TreeDiffRecord,
+        format_tree_diff,
+        print_tree_diff,
+        tree_diff,
+    )
+
+    from ._hash import (
+        TreeDedupeInfo,
+        tree_dedupe,
+        tree_fingerprint,
+        tree_memoize,
+    )
+
+    from ._index import (
+        TreeIndex,
+    )
+
+    from ._memory import (
+        MemoryPlan,
+        plan_memory,
+        recommend_chunk_size,
+    )
+
+    from ._packed import (
+        PackedTree,
+        tree_pack,
+        tree_unpack,
+    )
+
+    from ._pipeline import (
+        TreePipeline,
+    )
+
+    from ._print import (
+        print_tree_summary,
+        print_trees_side_by_side,
+        tree_summary_lines,
+    )
+
+    from ._progress import (
+        loop_tqdm,
+        scan_tqdm,
+    )
+
+    from ._sharding import (
+        tree_gather,
+        tree_shard,
+    )
+
+    from ._shm import (
+        SharedTree,
+        SharedTreeHandle,
+        tree_to_shared,
+    )
+
+    from ._transfer import (
+        HostTreeFuture,
+        tree_to_host,
+    )
+
+    from ._vmap import (
+        unkwarg_key,
+        vmap_multi,
+    )
+
+    from ._func import (
+        allf,
+        anyf,
+        compose,
+        notf,
+        idf,
+        is_not_type,
+        is_type,
+    )
+
+    from ._where import (
+        where_attr_strs_to_func,
+        where_func_to_strs,
+    )
+
+    from ._types import (
+        is_module,
+        is_none,
+    )
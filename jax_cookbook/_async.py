@@ -0,0 +1,149 @@
+"""Mapping I/O-bound functions over PyTrees concurrently."""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+from typing import Any, Optional, TypeVar, Union
+
+import jax.tree as jt
+from jaxtyping import PyTree
+
+from ._progress import _tqdm
+
+
+S = TypeVar("S")
+
+
+async def tree_map_async(
+    f: Callable[..., Union[S, Awaitable[S]]],
+    tree: PyTree[Any, "T"],
+    *rest: PyTree[Any, "T"],
+    concurrency: int = 8,
+    timeout: Optional[float] = None,
+    progress: bool = False,
+    label: Optional[str] = None,
+    labels: Optional[PyTree[str, "T"]] = None,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+) -> PyTree[S, "T"]:
+    """Map a function over the leaves of a PyTree concurrently, on an event loop.
+
+    This is for I/O-bound functions -- loading and saving files, querying a
+    database, etc. -- which `jt.map` or `tree_map_tqdm` would call one at a time.
+    Coroutine functions (and objects with an `async def __call__`) are called on the
+    event loop; other functions are run in threads, with `asyncio.to_thread`. If a
+    call returns an awaitable -- e.g. from a `lambda` that calls a coroutine function
+    -- it is then awaited. At most `concurrency` leaves are processed at once.
+
+    !!! Example
+        ```python
+        async def load(path):
+            async with aiofiles.open(path, "rb") as f:
+                return await f.read()
+
+        data = await tree_map_async(load, paths, concurrency=32, timeout=10)
+        ```
+
+    For callers that are not `async`, use
+    [`run_tree_map_async`][jax_cookbook.run_tree_map_async].
+
+    Arguments:
+        f: The function to map over the tree. May be a coroutine function, or
+            return an awaitable.
+        tree: The PyTree to map over.
+        *rest: Additional arguments to `f`, as PyTrees with the same structure as
+            `tree`.
+        concurrency: The maximum number of calls to `f` that may run at once.
+        timeout: The maximum time in seconds to wait for each call to `f`. Calls that
+            run in threads cannot be interrupted, so their threads keep running after
+            the timeout.
+        progress: Whether to show a progress bar.
+        label: The description shown on the progress bar.
+        labels: A PyTree of labels for the leaves of `tree` (e.g. from `tree_labels`),
+            shown on the progress bar and in timeout errors.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+
+    Returns:
+        A PyTree with the structure of `tree`, with the results of `f` as its leaves.
+
+    Raises:
+        TimeoutError: If a call to `f` takes longer than `timeout`. The other pending
+            calls are then cancelled.
+    """
+    leaves, treedef = jt.flatten(tree, is_leaf=is_leaf)
+    rest_leaves = [treedef.flatten_up_to(r) for r in rest]
+    if labels is None:
+        leaf_labels = [None] * len(leaves)
+    else:
+        leaf_labels = treedef.flatten_up_to(labels)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    is_coroutine = inspect.iscoroutinefunction(f) or inspect.iscoroutinefunction(
+        getattr(f, "__call__", None)
+    )
+    pbar = None
+    if progress:
+        pbar = _tqdm(total=len(leaves), desc=label or "Processing tree leaves")
+
+    async def call_f(*args):
+        if is_coroutine:
+            result = f(*args)
+        else:
+            result = await asyncio.to_thread(f, *args)
+        # Wrappers of coroutine functions, such as lambdas, are not detected above.
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def call(i: int):
+        args = (leaves[i], *(r[i] for r in rest_leaves))
+        async with semaphore:
+            try:
+                result = await asyncio.wait_for(call_f(*args), timeout)
+            except asyncio.TimeoutError:
+                leaf_desc = (
+                    f" on leaf {leaf_labels[i]!r}" if leaf_labels[i] is not None else ""
+                )
+                raise TimeoutError(f"Timed out after {timeout} s{leaf_desc}") from None
+        if pbar is not None:
+            if leaf_labels[i] is not None:
+                pbar.set_postfix_str(str(leaf_labels[i]), refresh=False)
+            pbar.update(1)
+        return result
+
+    tasks = [asyncio.ensure_future(call(i)) for i in range(len(leaves))]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        if pbar is not None:
+            pbar.close()
+    return jt.unflatten(treedef, results)
+
+
+def run_tree_map_async(
+    f: Callable[..., Union[S, Awaitable[S]]],
+    tree: PyTree[Any, "T"],
+    *rest: PyTree[Any, "T"],
+    **kwargs: Any,
+) -> PyTree[S, "T"]:
+    """Run [`tree_map_async`][jax_cookbook.tree_map_async] to completion, and return
+    its result.
+
+    This may be called from synchronous code. If an event loop is already running in
+    the calling thread (e.g. in a Jupyter notebook), a new loop is run in a separate
+    thread, and this blocks until it finishes.
+
+    Takes the same arguments as `tree_map_async`.
+    """
+    coro = tree_map_async(f, tree, *rest, **kwargs)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
@@ -0,0 +1,143 @@
+"""Iterating over minibatches of PyTree datasets."""
+
+from collections.abc import Iterator
+from typing import Any, Literal, Optional, Union
+
+import equinox as eqx
+import jax
+import jax.numpy as jnp
+import jax.random as jr
+import jax.tree as jt
+from jax.sharding import NamedSharding, PartitionSpec, Sharding
+from jaxtyping import PRNGKeyArray, PyTree
+import numpy as np
+
+from ._sharding import _default_mesh
+from ._tree import tree_infer_batch_size
+from .misc import prefetch_iterator
+
+
+def _take_rows(x, idxs: np.ndarray):
+    if isinstance(x, np.ndarray):
+        # Gather on the host, so that only the batch is transferred to the device.
+        return x[idxs]
+    return jnp.take(x, idxs, axis=0)
+
+
+class TreeBatchIterator:
+    """Iterates over minibatches of a PyTree dataset, prefetching them in the background.
+
+    The array leaves of `data` must share their first dimension, which is the
+    dimension that is sampled. Non-array leaves are included unchanged in every batch.
+
+    The next `prefetch` batches are gathered in a background thread and placed on the
+    device ahead of time, so that the training step does not wait on the gather or
+    the host-to-device transfer. NumPy leaves are gathered on the host, and JAX
+    array leaves on their device.
+
+    !!! Example
+        ```python
+        batches = TreeBatchIterator(data, batch_size=256, key=key, n_epochs=10)
+        for batch in batches:
+            model, opt_state = train_step(model, opt_state, batch)
+        ```
+
+    Arguments:
+        data: The dataset, as a PyTree whose array leaves share their first dimension.
+        batch_size: The number of examples in each batch.
+        key: The random key used to shuffle the dataset. Required if `shuffle` is
+            `True`.
+        shuffle: Whether to sample the examples in a random order, which is drawn
+            anew for each epoch. If `False`, examples are taken in order.
+        n_epochs: The number of passes through the dataset. If `None`, iterate
+            indefinitely.
+        drop_last: Whether to skip the final batch of each epoch, if it would be
+            smaller than `batch_size`.
+        prefetch: The maximum number of batches to prepare in advance.
+        sharding: How to place the array leaves of each batch. If `None`, they are
+            placed on the default device. If `"auto"`, their first dimension is split
+            across all the available devices; in this case `batch_size`, and the size
+            of the final batch if `drop_last` is `False`, must be divisible by the
+            number of devices. Otherwise, a `jax.sharding.Sharding` to apply to each
+            array leaf.
+    """
+
+    def __init__(
+        self,
+        data: PyTree[Any, "T"],
+        batch_size: int,
+        key: Optional[PRNGKeyArray] = None,
+        shuffle: bool = True,
+        n_epochs: Optional[int] = 1,
+        drop_last: bool = True,
+        prefetch: int = 2,
+        sharding: Optional[Union[Sharding, Literal["auto"]]] = None,
+    ):
+        self.n_examples = tree_infer_batch_size(data)
+        if shuffle and key is None:
+            raise ValueError("A random `key` is required when `shuffle` is `True`")
+        if batch_size > self.n_examples and drop_last:
+            raise ValueError(
+                f"Batch size {batch_size} exceeds the dataset size {self.n_examples}"
+            )
+        if sharding == "auto":
+            devices = jax.devices()
+            if batch_size % len(devices):
+                raise ValueError(
+                    f"Batch size {batch_size} is not divisible by the number of "
+                    f"devices ({len(devices)})"
+                )
+            n_final = self.n_examples % batch_size
+            if not drop_last and n_final % len(devices):
+                raise ValueError(
+                    f"The final batch of each epoch, of size {n_final}, is not "
+                    f"divisible by the number of devices ({len(devices)}); pass "
+                    f"`drop_last=True` to skip it"
+                )
+            sharding = NamedSharding(_default_mesh("batch"), PartitionSpec("batch"))
+
+        arrays, self._static = eqx.partition(data, eqx.is_array)
+        self._leaves, self._treedef = jt.flatten(arrays)
+        self.batch_size = batch_size
+        self.key = key
+        self.shuffle = shuffle
+        self.n_epochs = n_epochs
+        self.drop_last = drop_last
+        self.prefetch = prefetch
+        self.sharding = sharding
+
+    @property
+    def batches_per_epoch(self) -> int:
+        if self.drop_last:
+            return self.n_examples // self.batch_size
+        return -(-self.n_examples // self.batch_size)
+
+    def __len__(self) -> int:
+        if self.n_epochs is None:
+            raise TypeError("An iterator with `n_epochs=None` has no length")
+        return self.batches_per_epoch * self.n_epochs
+
+    def _batch_indices(self) -> Iterator[np.ndarray]:
+        key = self.key
+        epoch = 0
+        while self.n_epochs is None or epoch < self.n_epochs:
+            if self.shuffle:
+                key, subkey = jr.split(key)
+                order = np.asarray(jr.permutation(subkey, self.n_examples))
+            else:
+                order = np.arange(self.n_examples)
+            for i in range(self.batches_per_epoch):
+                yield order[i * self.batch_size : (i + 1) * self.batch_size]
+            epoch += 1
+
+    def _batches(self) -> Iterator[PyTree[Any, "T"]]:
+        for idxs in self._batch_indices():
+            leaves = [_take_rows(x, idxs) for x in self._leaves]
+            if self.sharding is None:
+                leaves = jax.device_put(leaves)
+            else:
+                leaves = jax.device_put(leaves, self.sharding)
+            yield eqx.combine(jt.unflatten(self._treedef, leaves), self._static)
+
+    def __iter__(self) -> Iterator[PyTree[Any, "T"]]:
+        return prefetch_iterator(self._batches(), size=self.prefetch)
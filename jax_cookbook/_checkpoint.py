@@ -0,0 +1,282 @@
+"""Checkpointing of PyTrees that only writes the leaves that have changed."""
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Optional, Union
+
+import equinox as eqx
+import jax
+import jax.numpy as jnp
+import jax.tree as jt
+import jax.tree_util as jtu
+from jaxtyping import PyTree
+import numpy as np
+
+from ._hash import _array_digests
+from ._tree import _path_to_label
+
+
+_LABEL_SEP = '.'
+_MANIFEST_SUFFIX = ".json"
+
+
+def _atomic_write(path: Path, write: Callable[[Any], None], mode: str = "wb"):
+    """Write a file by writing a temporary file in the same directory, then renaming
+    it, so that readers never see a partially written file."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _labeled_leaves(
+    tree: PyTree[Any],
+    is_leaf: Optional[Callable[[Any], bool]],
+) -> tuple[list[str], list[Any], jtu.PyTreeDef]:
+    leaves_with_path, treedef = jtu.tree_flatten_with_path(tree, is_leaf=is_leaf)
+    labels = [_path_to_label(path, _LABEL_SEP) for path, _ in leaves_with_path]
+    if len(set(labels)) != len(labels):
+        seen, duplicates = set(), set()
+        for label in labels:
+            (duplicates if label in seen else seen).add(label)
+        raise ValueError(
+            f"Leaves of the PyTree do not have unique labels: {sorted(duplicates)}"
+        )
+    return labels, [leaf for _, leaf in leaves_with_path], treedef
+
+
+class DeltaCheckpointer:
+    """Writes snapshots of a PyTree to a directory, storing each distinct array once.
+
+    Each array leaf is stored as a `.npy` blob named by a hash of its contents, and
+    each snapshot is a JSON manifest that maps the labels of the leaves (as with
+    `tree_labels(tree, join_with='.')`) to blobs. Saving a snapshot only writes the
+    blobs that do not already exist, so leaves that have not changed since an earlier
+    snapshot -- frozen layers, buffers, etc. -- are never written again. Since the
+    hashes of JAX arrays are cached while the arrays are alive, unchanged JAX arrays
+    are not even transferred to the host.
+
+    !!! Example
+        ```python
+        checkpointer = DeltaCheckpointer("checkpoints")
+        for step in range(n_steps):
+            model, opt_state = train_step(model, opt_state, batch)
+            if step % 500 == 0:
+                checkpointer.save((model, opt_state), step)
+        checkpointer.gc(keep=3)
+
+        # Later, with a PyTree of the same structure:
+        model, opt_state = checkpointer.restore(like=(model, opt_state))
+        ```
+
+    Non-array leaves are not stored, and are taken from the `like` argument when
+    restoring.
+
+    Arguments:
+        directory: The directory in which to store the blobs and manifests. It is
+            created if it does not exist.
+        max_workers: The maximum number of threads used to hash and write arrays.
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike], max_workers: Optional[int] = None):
+        self.directory = Path(directory)
+        self.max_workers = max_workers
+        self._blob_dir = self.directory / "blobs"
+        self._manifest_dir = self.directory / "manifests"
+        self._blob_dir.mkdir(parents=True, exist_ok=True)
+        self._manifest_dir.mkdir(parents=True, exist_ok=True)
+
+    def _blob_path(self, digest: str) -> Path:
+        return self._blob_dir / digest[:2] / f"{digest}.npy"
+
+    def _manifest_path(self, step: int) -> Path:
+        return self._manifest_dir / f"{step:012d}{_MANIFEST_SUFFIX}"
+
+    @property
+    def steps(self) -> list[int]:
+        """The steps of the saved snapshots, in increasing order."""
+        return sorted(
+            int(path.stem) for path in self._manifest_dir.glob(f"*{_MANIFEST_SUFFIX}")
+        )
+
+    def manifest(self, step: Optional[int] = None) -> dict[str, Any]:
+        """Return the manifest of a snapshot; by default, of the latest one."""
+        if step is None:
+            steps = self.steps
+            if not steps:
+                raise FileNotFoundError(f"No snapshots in {self.directory}")
+            step = steps[-1]
+        with open(self._manifest_path(step)) as f:
+            return json.load(f)
+
+    def save(
+        self,
+        tree: PyTree[Any],
+        step: int,
+        where: Optional[Callable[[PyTree[Any]], Any]] = None,
+        is_leaf: Optional[Callable[[Any], bool]] = None,
+    ) -> int:
+        """Save a snapshot of `tree` for `step`.
+
+        Arguments:
+            tree: The PyTree to save. Its array leaves must not be traced.
+            step: The step of the snapshot. Saving a step again replaces its manifest.
+            where: An optional function that selects the subtrees of `tree` that may
+                have changed since the latest snapshot, as with `eqx.tree_at`. Only
+                the leaves in these subtrees are hashed; the other leaves point at the
+                same blobs as in the latest snapshot.
+            is_leaf: An optional function that decides whether each node in `tree`
+                should be treated as a leaf, or traversed as a subtree.
+
+        Returns:
+            The number of bytes of array data written.
+        """
+        labels, leaves, _ = _labeled_leaves(tree, is_leaf)
+
+        previous_entries = {}
+        if where is not None:
+            if self.steps:
+                previous_entries = self.manifest()["leaves"]
+            mask = eqx.tree_at(
+                where,
+                jt.map(lambda _: False, tree, is_leaf=is_leaf),
+                replace_fn=lambda node: jt.map(lambda _: True, node),
+            )
+            selected = jt.leaves(mask)
+        else:
+            selected = [True] * len(leaves)
+
+        entries: dict[str, Optional[dict[str, Any]]] = {}
+        to_hash = []
+        for i, (label, leaf) in enumerate(zip(labels, leaves)):
+            if not eqx.is_array(leaf):
+                entries[label] = None
+            elif not selected[i] and previous_entries.get(label) is not None:
+                entries[label] = previous_entries[label]
+            else:
+                to_hash.append(i)
+
+        digests = [
+            digest.hex() for digest in _array_digests(
+                [leaves[i] for i in to_hash], max_workers=self.max_workers
+            )
+        ]
+        to_write = {}
+        for i, digest in zip(to_hash, digests):
+            leaf = leaves[i]
+            entries[labels[i]] = dict(
+                blob=digest,
+                # Unlike `dtype.str`, the name identifies extended dtypes such as
+                # bfloat16, which NumPy stores as raw bytes (e.g. `'<V2'`).
+                dtype=jnp.dtype(leaf.dtype).name,
+                shape=list(leaf.shape),
+            )
+            if digest not in to_write and not self._blob_path(digest).exists():
+                to_write[digest] = leaf
+
+        host_arrays = jax.device_get(list(to_write.values()))
+
+        def write_blob(digest: str, x: np.ndarray):
+            path = self._blob_path(digest)
+            path.parent.mkdir(exist_ok=True)
+            _atomic_write(path, lambda f: np.save(f, np.asarray(x), allow_pickle=False))
+            return np.asarray(x).nbytes
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            n_bytes = sum(executor.map(write_blob, to_write.keys(), host_arrays))
+
+        manifest = dict(
+            step=step,
+            leaves={label: entries[label] for label in labels},
+        )
+        _atomic_write(
+            self._manifest_path(step),
+            lambda f: json.dump(manifest, f, indent=1),
+            mode="w",
+        )
+        return n_bytes
+
+    def restore(
+        self,
+        step: Optional[int] = None,
+        like: Optional[PyTree[Any, "T"]] = None,
+        mmap: bool = True,
+        is_leaf: Optional[Callable[[Any], bool]] = None,
+    ) -> Union[PyTree[Any, "T"], dict[str, np.ndarray]]:
+        """Restore a snapshot.
+
+        Arguments:
+            step: The step of the snapshot to restore. Defaults to the latest one.
+            like: A PyTree with the same structure as the saved tree. Its array leaves
+                are replaced by the saved arrays, and its other leaves are kept.
+                If `None`, a flat dict from labels to arrays is returned instead.
+            mmap: If `True`, the arrays are memory-mapped from their blobs, so that
+                their data is only read from disk when it is accessed.
+            is_leaf: An optional function that decides whether each node in `like`
+                should be treated as a leaf, or traversed as a subtree.
+
+        Returns:
+            A PyTree like `like`, or a dict, whose array leaves are NumPy arrays. Pass
+            it to `jax.device_put` to move the arrays to a device.
+        """
+        entries = self.manifest(step)["leaves"]
+        mmap_mode = "r" if mmap else None
+
+        def load(label: str) -> np.ndarray:
+            entry = entries.get(label)
+            if entry is None:
+                raise KeyError(f"No array with label {label!r} in the snapshot")
+            x = np.load(
+                self._blob_path(entry["blob"]), mmap_mode=mmap_mode, allow_pickle=False
+            )
+            dtype = jnp.dtype(entry["dtype"])
+            return x if x.dtype == dtype else x.view(dtype)
+
+        if like is None:
+            return {
+                label: load(label) for label, entry in entries.items()
+                if entry is not None
+            }
+
+        labels, leaves, treedef = _labeled_leaves(like, is_leaf)
+        return jt.unflatten(treedef, [
+            load(label) if eqx.is_array(leaf) else leaf
+            for label, leaf in zip(labels, leaves)
+        ])
+
+    def gc(self, keep: Optional[int] = None) -> int:
+        """Delete old snapshots, and the blobs no longer referenced by any snapshot.
+
+        Arguments:
+            keep: The number of most recent snapshots to keep. If `None`, all the
+                snapshots are kept, and only unreferenced blobs are deleted.
+
+        Returns:
+            The number of blobs deleted.
+        """
+        steps = self.steps
+        if keep is not None:
+            for step in steps[:max(0, len(steps) - keep)]:
+                self._manifest_path(step).unlink()
+            steps = steps[max(0, len(steps) - keep):]
+
+        referenced = set()
+        for step in steps:
+            for entry in self.manifest(step)["leaves"].values():
+                if entry is not None:
+                    referenced.add(entry["blob"])
+
+        n_deleted = 0
+        for path in self._blob_dir.glob("*/*.npy"):
+            if path.stem not in referenced:
+                path.unlink()
+                n_deleted += 1
+        return n_deleted
@@ -0,0 +1,300 @@
+"""Compressed host storage for large PyTrees of arrays."""
+
+from collections.abc import Callable, Mapping
+from fnmatch import fnmatchcase
+from typing import Any, Literal, NamedTuple, Optional, Union
+import zlib
+
+import equinox as eqx
+import jax
+import jax.numpy as jnp
+import jax.tree as jt
+import jax.tree_util as jtu
+from jaxtyping import ArrayLike, PyTree
+import numpy as np
+
+from ._tree import _path_to_label
+
+
+CompressionMethod = Literal["none", "bf16", "fp16", "int8", "int8_block", "zlib"]
+
+CompressionPolicy = Union[
+    CompressionMethod,
+    Mapping[str, CompressionMethod],
+    Callable[[str, np.ndarray], CompressionMethod],
+]
+
+_LOSSY_FLOAT_METHODS = ("bf16", "fp16", "int8", "int8_block")
+_INT8_MAX = 127
+
+
+class CompressionStats(NamedTuple):
+    """How a single leaf of a `CompressedTree` was compressed.
+
+    Attributes:
+        method: The compression method.
+        original_bytes: The size of the original array.
+        compressed_bytes: The size of the compressed data.
+        ratio: `original_bytes / compressed_bytes`.
+        max_abs_error: The maximum absolute difference between the original array
+            and its decompressed values; zero for lossless methods.
+    """
+
+    method: CompressionMethod
+    original_bytes: int
+    compressed_bytes: int
+    ratio: float
+    max_abs_error: float
+
+
+def _resolve_method(
+    policy: CompressionPolicy,
+    label: str,
+    x: np.ndarray,
+) -> CompressionMethod:
+    if isinstance(policy, str):
+        method = policy
+    elif isinstance(policy, Mapping):
+        method = next(
+            (m for pattern, m in policy.items() if fnmatchcase(label, pattern)),
+            "none",
+        )
+    else:
+        method = policy(label, x)
+
+    if x.ndim == 0 or x.size == 0:
+        return "none"
+    if method in _LOSSY_FLOAT_METHODS and not jnp.issubdtype(x.dtype, jnp.floating):
+        # Lossy methods would change the values of integer and boolean leaves.
+        return "zlib"
+    if method in ("int8", "int8_block") and not np.all(np.isfinite(x)):
+        # Non-finite values cannot be represented with a finite scale.
+        return "zlib"
+    return method
+
+
+class _CompressedLeaf:
+    """A single array, compressed along blocks of rows of its first axis."""
+
+    def __init__(self, x: np.ndarray, method: CompressionMethod, block_rows: int):
+        self.method = method
+        self.shape = x.shape
+        self.dtype = x.dtype
+        self.block_rows = block_rows
+        self.scale = None
+
+        if method == "none":
+            self.data = x
+        elif method == "bf16":
+            self.data = x.astype(jnp.bfloat16)
+        elif method == "fp16":
+            self.data = x.astype(np.float16)
+        elif method == "int8":
+            max_abs = np.maximum(np.max(np.abs(x)), jnp.finfo(x.dtype).tiny)
+            self.scale = max_abs / _INT8_MAX
+            self.data = np.round(x / self.scale).astype(np.int8)
+        elif method == "int8_block":
+            row_max = np.max(np.abs(x.reshape(x.shape[0], -1)), axis=1)
+            block_max = np.maximum.reduceat(row_max, np.arange(0, x.shape[0], block_rows))
+            self.scale = np.maximum(block_max, jnp.finfo(x.dtype).tiny) / _INT8_MAX
+            self.data = np.round(x / self._row_scales(np.arange(x.shape[0]))).astype(np.int8)
+        elif method == "zlib":
+            x = np.ascontiguousarray(x)
+            self.data = [
+                zlib.compress(x[start:start + block_rows].tobytes())
+                for start in range(0, x.shape[0], block_rows)
+            ]
+        else:
+            raise ValueError(f"Unknown compression method: {method!r}")
+
+        if method in ("none", "zlib"):
+            self.max_abs_error = 0.0
+        else:
+            self.max_abs_error = float(np.max(np.abs(self.decompress() - x)))
+
+    @property
+    def nbytes(self) -> int:
+        if self.method == "zlib":
+            return sum(len(block) for block in self.data)
+        scale_bytes = 0 if self.scale is None else np.asarray(self.scale).nbytes
+        return self.data.nbytes + scale_bytes
+
+    def _row_scales(self, rows: np.ndarray) -> np.ndarray:
+        scales = self.scale[rows // self.block_rows]
+        return scales.reshape((-1,) + (1,) * (len(self.shape) - 1))
+
+    def decompress(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Decompress the whole array, or only the given rows of its first axis."""
+        if self.method == "zlib":
+            row_bytes = int(np.prod(self.shape[1:], dtype=np.int64)) * self.dtype.itemsize
+            n_rows = self.shape[0]
+            if rows is None:
+                blocks = range(len(self.data))
+            else:
+                rows = np.arange(n_rows)[rows]
+                blocks = np.unique(np.atleast_1d(rows) // self.block_rows)
+            decompressed = {
+                int(b): np.frombuffer(zlib.decompress(self.data[b]), dtype=self.dtype)
+                .reshape((-1,) + self.shape[1:])
+                for b in blocks
+            }
+            if rows is None:
+                return np.concatenate([decompressed[b] for b in blocks], axis=0)
+            if rows.size == 0:
+                return np.empty(np.shape(rows) + self.shape[1:], dtype=self.dtype)
+            return np.stack([
+                decompressed[int(r) // self.block_rows][int(r) % self.block_rows]
+                for r in np.ravel(rows)
+            ]).reshape(np.shape(rows) + self.shape[1:])
+
+        data = self.data if rows is None else self.data[rows]
+        if self.method == "none":
+            return data
+        if self.method == "int8":
+            return (data * self.scale).astype(self.dtype)
+        if self.method == "int8_block":
+            row_idxs = np.arange(self.shape[0])
+            if rows is not None:
+                row_idxs = row_idxs[rows]
+            scales = self._row_scales(np.ravel(row_idxs)).reshape(
+                np.shape(row_idxs) + (1,) * (len(self.shape) - 1)
+            )
+            return (data * scales).astype(self.dtype)
+        return data.astype(self.dtype)
+
+
+class CompressedTree:
+    """A PyTree whose array leaves are stored compressed, in host memory.
+
+    The compression method of each array leaf is chosen by a policy, based on the
+    leaf's label (as with `tree_labels(tree, join_with='.')`):
+
+    - `"none"`: stored as-is.
+    - `"bf16"`, `"fp16"`: stored as 16-bit floats.
+    - `"int8"`: stored as 8-bit integers, with a single scale for the leaf.
+    - `"int8_block"`: stored as 8-bit integers, with a scale for each block of
+        `block_rows` rows of the first axis.
+    - `"zlib"`: compressed losslessly, in blocks of `block_rows` rows of the first
+        axis.
+
+    Lossy methods are only applied to floating-point leaves; other leaves are
+    compressed with `"zlib"` instead, as are leaves with non-finite values, for the
+    `int8` methods.
+
+    Leaves are only decompressed when they are accessed, and are not cached. Use
+    [`take`][jax_cookbook.CompressedTree.take] to decompress only some rows.
+
+    !!! Example
+        ```python
+        states = CompressedTree(
+            tree_stack(state_history),
+            policy={"*.hidden": "int8_block", "*.pos": "bf16", "*": "zlib"},
+        )
+        print(states.compression_ratio)
+        first_trials = states.take(jnp.arange(10))
+        ```
+
+    Arguments:
+        tree: The PyTree to compress. Its array leaves are copied to the host.
+        policy: Either a single compression method for all array leaves; a mapping
+            from `fnmatch` patterns of leaf labels to methods, where the first
+            matching pattern is used (and unmatched leaves are not compressed); or a
+            function that returns the method, given the label and the array of a leaf.
+        block_rows: The number of rows of the first axis in each block, for the
+            `"int8_block"` and `"zlib"` methods. Smaller blocks make `take` cheaper.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+    """
+
+    def __init__(
+        self,
+        tree: PyTree[Any, "T"],
+        policy: CompressionPolicy = "zlib",
+        block_rows: int = 256,
+        is_leaf: Optional[Callable[[Any], bool]] = None,
+    ):
+        leaves_with_path, self._treedef = jtu.tree_flatten_with_path(tree, is_leaf=is_leaf)
+        self._labels = [_path_to_label(path, '.') for path, _ in leaves_with_path]
+        leaves = [leaf for _, leaf in leaves_with_path]
+        array_idxs = [i for i, leaf in enumerate(leaves) if eqx.is_array(leaf)]
+        host_arrays = jax.device_get([leaves[i] for i in array_idxs])
+        for i, x in zip(array_idxs, host_arrays):
+            x = np.asarray(x)
+            method = _resolve_method(policy, self._labels[i], x)
+            leaves[i] = _CompressedLeaf(x, method, block_rows)
+        self._leaves = leaves
+
+    @property
+    def labels(self) -> list[str]:
+        """The labels of all the leaves, in order."""
+        return list(self._labels)
+
+    def __getitem__(self, label: str) -> Any:
+        """Decompress and return a single leaf, given its label."""
+        try:
+            leaf = self._leaves[self._labels.index(label)]
+        except ValueError:
+            raise KeyError(label) from None
+        return leaf.decompress() if isinstance(leaf, _CompressedLeaf) else leaf
+
+    def decompress(self) -> PyTree[Any, "T"]:
+        """Return the PyTree, with all its array leaves decompressed as NumPy arrays."""
+        return jt.unflatten(self._treedef, [
+            leaf.decompress() if isinstance(leaf, _CompressedLeaf) else leaf
+            for leaf in self._leaves
+        ])
+
+    def take(self, indices: ArrayLike, axis: int = 0) -> PyTree[Any, "T"]:
+        """Index elements out of one axis of each array leaf, as with `tree_take`.
+
+        When `axis` is 0, only the blocks of rows containing the requested indices
+        are decompressed. Any non-array leaves are returned unchanged.
+        """
+        indices = np.asarray(indices)
+        if indices.size == 0:
+            # e.g. `np.asarray([])`, which is a float array.
+            indices = indices.astype(np.intp)
+
+        def take_leaf(leaf):
+            if not isinstance(leaf, _CompressedLeaf):
+                return leaf
+            if axis == 0:
+                return leaf.decompress(indices)
+            return np.take(leaf.decompress(), indices, axis=axis)
+
+        return jt.unflatten(self._treedef, [take_leaf(leaf) for leaf in self._leaves])
+
+    def report(self) -> dict[str, CompressionStats]:
+        """Return how each array leaf was compressed, keyed by its label."""
+        stats = {}
+        for label, leaf in zip(self._labels, self._leaves):
+            if not isinstance(leaf, _CompressedLeaf):
+                continue
+            original_bytes = int(np.prod(leaf.shape, dtype=np.int64)) * leaf.dtype.itemsize
+            stats[label] = CompressionStats(
+                method=leaf.method,
+                original_bytes=original_bytes,
+                compressed_bytes=leaf.nbytes,
+                ratio=original_bytes / max(leaf.nbytes, 1),
+                max_abs_error=leaf.max_abs_error,
+            )
+        return stats
+
+    @property
+    def nbytes(self) -> int:
+        """The total size of the compressed array data."""
+        return sum(
+            leaf.nbytes for leaf in self._leaves if isinstance(leaf, _CompressedLeaf)
+        )
+
+    @property
+    def compression_ratio(self) -> float:
+        """The total size of the original arrays, divided by `nbytes`."""
+        stats = self.report().values()
+        return sum(s.original_bytes for s in stats) / max(self.nbytes, 1)
+
+    def __repr__(self) -> str:
+        return (
+            f"CompressedTree({len(self.report())} arrays, {self.nbytes:,} bytes, "
+            f"ratio {self.compression_ratio:.2f})"
+        )
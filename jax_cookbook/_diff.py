@@ -0,0 +1,246 @@
+"""Structural comparison of PyTrees."""
+
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from typing import Any, Literal, Optional
+
+import equinox as eqx
+import jax
+import jax.numpy as jnp
+
+from ._tree import (
+    BuiltInKeyEntry,
+    _accumulation_dtype,
+    _flatten_one_level_with_keys,
+    _path_to_label,
+)
+
+
+DiffKind = Literal["added", "removed", "type", "structure", "dtype", "shape", "value"]
+
+
+@dataclass(frozen=True)
+class TreeDiffRecord:
+    """A difference between two PyTrees, at a single path.
+
+    Attributes:
+        path: The key path of the differing node.
+        kind: What differs: `"added"` or `"removed"` for nodes present in only one
+            of the trees; `"type"` for nodes of different types; `"structure"` for
+            nodes of the same type with different metadata (e.g. static fields);
+            `"dtype"` or `"shape"` for arrays; `"value"` for arrays with different
+            elements, or other leaves that are not equal.
+        old: A short description of the node in the first tree.
+        new: A short description of the node in the second tree.
+        max_abs_diff: For `"value"` differences between arrays, the maximum absolute
+            difference between their elements.
+        max_rel_diff: For `"value"` differences between arrays, the maximum relative
+            difference between their elements.
+    """
+
+    path: tuple[BuiltInKeyEntry, ...]
+    kind: DiffKind
+    old: Optional[str] = None
+    new: Optional[str] = None
+    max_abs_diff: Optional[float] = None
+    max_rel_diff: Optional[float] = None
+
+
+def _short_repr(x: Any, max_len: int = 60) -> str:
+    if eqx.is_array(x):
+        return f"{jnp.dtype(x.dtype).name}{list(x.shape)}"
+    s = repr(x)
+    if len(s) > max_len:
+        s = s[: max_len - 3] + "..."
+    return s
+
+
+def _leaves_equal(a: Any, b: Any) -> bool:
+    if a is b:
+        return True
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
+
+
+@jax.jit
+def _max_diffs(pairs):
+    max_abs, max_rel = [], []
+    for a, b in pairs:
+        dtype = jnp.promote_types(
+            _accumulation_dtype(a.dtype), _accumulation_dtype(b.dtype)
+        )
+        a, b = a.astype(dtype), b.astype(dtype)
+        nan_a, nan_b = jnp.isnan(a), jnp.isnan(b)
+        diff = jnp.abs(a - b)
+        diff = jnp.where(nan_a & nan_b, 0, diff)
+        diff = jnp.where(nan_a ^ nan_b, jnp.inf, diff)
+        scale = jnp.maximum(jnp.abs(a), jnp.abs(b))
+        rel = jnp.where(scale > 0, diff / jnp.where(scale > 0, scale, 1), 0)
+        max_abs.append(jnp.max(diff, initial=0))
+        max_rel.append(jnp.max(jnp.where(jnp.isnan(rel), jnp.inf, rel), initial=0))
+    return jnp.stack(max_abs), jnp.stack(max_rel)
+
+
+def tree_diff(
+    tree1: Any,
+    tree2: Any,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+    join_with: str = '.',
+) -> dict[str, TreeDiffRecord]:
+    """Compare two PyTrees node by node, and return their differences.
+
+    The trees are walked in parallel. Subtrees that are the same object in both trees
+    are skipped. Nodes that are present in only one of the trees, or that differ in
+    type, are reported without descending into them. Array leaves are compared by
+    dtype and shape; for pairs of arrays with the same shape, the maximum absolute
+    and relative differences are computed for all pairs at once, in a single device
+    call. Other leaves are compared with `==`.
+
+    This is much faster than comparing the `repr`s of large trees, as with
+    `highlight_string_diff`.
+
+    Arguments:
+        tree1: The first ("old") PyTree.
+        tree2: The second ("new") PyTree.
+        is_leaf: An optional function that decides whether each node
+            should be treated as a leaf, or traversed as a subtree.
+        join_with: The string with which to join path keys, to form the labels used
+            as the keys of the returned dict. Raises a `ValueError` if the labels of
+            two differing paths are the same.
+
+    Returns:
+        A dict from the labels of differing paths to `TreeDiffRecord`s, in the order
+        that the paths are encountered in `tree1`. Paths only in `tree2` follow the
+        other children of their parent node.
+    """
+    records: list[Optional[TreeDiffRecord]] = []
+    array_pairs: list[tuple[int, tuple, Any, Any]] = []
+
+    def add(path, kind, a=None, b=None):
+        records.append(TreeDiffRecord(
+            path,
+            kind,
+            None if kind == "added" else _short_repr(a),
+            None if kind == "removed" else _short_repr(b),
+        ))
+
+    def walk(a, b, path):
+        if a is b:
+            return
+        flat_a = _flatten_one_level_with_keys(a, is_leaf)
+        flat_b = _flatten_one_level_with_keys(b, is_leaf)
+
+        if flat_a is None and flat_b is None:
+            if eqx.is_array(a) and eqx.is_array(b):
+                if a.shape != b.shape:
+                    add(path, "shape", a, b)
+                elif jnp.dtype(a.dtype) != jnp.dtype(b.dtype):
+                    add(path, "dtype", a, b)
+                else:
+                    # Placeholder, to keep the records in order.
+                    array_pairs.append((len(records), path, a, b))
+                    records.append(None)
+            elif type(a) is not type(b):
+                add(path, "type", a, b)
+            elif not _leaves_equal(a, b):
+                add(path, "value", a, b)
+            return
+
+        if flat_a is None or flat_b is None or type(a) is not type(b):
+            add(path, "type", a, b)
+            return
+
+        (children_a, treedef_a), (children_b, treedef_b) = flat_a, flat_b
+        keys_a = [key for key, _ in children_a]
+        keys_b = [key for key, _ in children_b]
+        if keys_a == keys_b and treedef_a != treedef_b:
+            add(path, "structure", a, b)
+            return
+
+        children_b_by_key = dict(children_b)
+        keys_a_set = set(keys_a)
+        for key, child_a in children_a:
+            if key in children_b_by_key:
+                walk(child_a, children_b_by_key[key], path + (key,))
+            else:
+                add(path + (key,), "removed", child_a)
+        for key, child_b in children_b:
+            if key not in keys_a_set:
+                add(path + (key,), "added", None, child_b)
+
+    walk(tree1, tree2, ())
+
+    if array_pairs:
+        max_abs, max_rel = jax.device_get(
+            _max_diffs([(a, b) for _, _, a, b in array_pairs])
+        )
+        for (i, path, a, b), abs_diff, rel_diff in zip(array_pairs, max_abs, max_rel):
+            if abs_diff > 0:
+                records[i] = TreeDiffRecord(
+                    path,
+                    "value",
+                    _short_repr(a),
+                    _short_repr(b),
+                    float(abs_diff),
+                    float(rel_diff),
+                )
+
+    diff = {}
+    duplicates = set()
+    for record in records:
+        if record is None:
+            continue
+        label = _path_to_label(record.path, join_with)
+        if label in diff:
+            duplicates.add(label)
+        diff[label] = record
+    if duplicates:
+        raise ValueError(
+            f"Differing paths of the PyTrees do not have unique labels: "
+            f"{sorted(duplicates)}; try a different `join_with`"
+        )
+    return diff
+
+
+_DIFF_COLORS = {
+    "added": "\033[92m",
+    "removed": "\033[91m",
+}
+_CHANGED_COLOR = "\033[93m"
+_RESET = "\033[0m"
+
+
+def format_tree_diff(
+    diff: dict[str, TreeDiffRecord],
+    color: bool = True,
+) -> Iterator[str]:
+    """Yields one line of text for each record returned by `tree_diff`."""
+    for label, record in diff.items():
+        label = label or "<root>"
+        if record.kind == "added":
+            line = f"+ {label}: {record.new}"
+        elif record.kind == "removed":
+            line = f"- {label}: {record.old}"
+        else:
+            line = f"~ {label}: {record.kind} {record.old} -> {record.new}"
+            if record.max_abs_diff is not None:
+                line += (
+                    f" (max abs diff {record.max_abs_diff:.3g}, "
+                    f"max rel diff {record.max_rel_diff:.3g})"
+                )
+        if color:
+            line = f"{_DIFF_COLORS.get(record.kind, _CHANGED_COLOR)}{line}{_RESET}"
+        yield line
+
+
+def print_tree_diff(
+    tree1: Any,
+    tree2: Any,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+    color: bool = True,
+):
+    """Print the differences between two PyTrees, as found by `tree_diff`."""
+    for line in format_tree_diff(tree_diff(tree1, tree2, is_leaf=is_leaf), color=color):
+        print(line)
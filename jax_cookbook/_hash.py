@@ -0,0 +1,389 @@
+"""Content hashing of PyTrees, and caching and deduplication based on it."""
+
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import threading
+from typing import Any, NamedTuple, Optional, Union
+import weakref
+
+import equinox as eqx
+import jax
+import jax.tree as jt
+from jaxtyping import ArrayLike, PyTree
+import numpy as np
+
+from ._tree import tree_array_bytes
+
+
+_DIGEST_SIZE = 16
+
+
+# Maps `id(x)` to `(weakref(x), digest)`, for immutable JAX arrays only. NumPy arrays
+# are mutable, so their hashes are never cached.
+_array_digest_cache: dict[int, tuple[weakref.ref, bytes]] = {}
+_array_digest_cache_lock = threading.Lock()
+
+
+def _get_cached_digest(x: jax.Array) -> Optional[bytes]:
+    entry = _array_digest_cache.get(id(x))
+    if entry is not None and entry[0]() is x:
+        return entry[1]
+    return None
+
+
+def _set_cached_digest(x: jax.Array, digest: bytes):
+    key = id(x)
+
+    def remove(ref):
+        with _array_digest_cache_lock:
+            entry = _array_digest_cache.get(key)
+            if entry is not None and entry[0] is ref:
+                del _array_digest_cache[key]
+
+    with _array_digest_cache_lock:
+        _array_digest_cache[key] = (weakref.ref(x, remove), digest)
+
+
+def _host_array_digest(x: np.ndarray) -> bytes:
+    x = np.ascontiguousarray(x)
+    h = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+    # Unlike `dtype.str`, the name distinguishes extended dtypes of the same size, such
+    # as bfloat16 and float16 (both `'<V2'`).
+    h.update(f"{x.dtype.name}{x.shape}".encode())
+    # `hashlib` releases the GIL for large buffers, so this parallelizes over threads.
+    h.update(x.reshape(-1).view(np.uint8))
+    return h.digest()
+
+
+def _array_digests(
+    arrays: Sequence[ArrayLike],
+    max_workers: Optional[int] = None,
+    return_host_arrays: bool = False,
+) -> Union[list[bytes], tuple[list[bytes], list[Optional[np.ndarray]]]]:
+    """Return content digests for a sequence of JAX or NumPy arrays.
+
+    Uncached JAX arrays are transferred to the host together, and all the host
+    buffers are hashed in parallel threads. If `return_host_arrays` is `True`, also
+    return the host copy of each array that was hashed, or `None` for JAX arrays
+    whose digests were cached, so that callers need not transfer them again.
+    """
+    digests: list[Optional[bytes]] = [None] * len(arrays)
+    to_fetch: list[int] = []
+    for i, x in enumerate(arrays):
+        if isinstance(x, jax.core.Tracer):
+            raise TypeError("Cannot hash the contents of a traced array")
+        if isinstance(x, jax.Array):
+            digests[i] = _get_cached_digest(x)
+            if digests[i] is None:
+                to_fetch.append(i)
+
+    fetched = dict(zip(to_fetch, jax.device_get([arrays[i] for i in to_fetch])))
+    to_hash = [i for i, digest in enumerate(digests) if digest is None]
+    host_arrays = [fetched[i] if i in fetched else np.asarray(arrays[i]) for i in to_hash]
+
+    if len(host_arrays) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            new_digests = list(executor.map(_host_array_digest, host_arrays))
+    else:
+        new_digests = [_host_array_digest(x) for x in host_arrays]
+
+    for i, digest in zip(to_hash, new_digests):
+        digests[i] = digest
+        if i in fetched:
+            _set_cached_digest(arrays[i], digest)
+
+    if return_host_arrays:
+        host: list[Optional[np.ndarray]] = [None] * len(arrays)
+        for i, x in zip(to_hash, host_arrays):
+            host[i] = x
+        return digests, host  # type: ignore
+    return digests  # type: ignore
+
+
+def tree_fingerprint(
+    tree: PyTree[Any],
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+    max_workers: Optional[int] = None,
+) -> str:
+    """Returns a hash of the structure and contents of a PyTree.
+
+    Two PyTrees have the same fingerprint if they have the same structure, their
+    non-array leaves have the same `repr`, and their array leaves have the same
+    shapes, dtypes, and bytes.
+
+    Array leaves are transferred to the host as a batch and hashed in parallel threads.
+    The hashes of JAX arrays are cached for as long as the arrays are alive, since
+    they are immutable; fingerprinting a tree whose arrays have already been
+    fingerprinted does not touch their data again.
+
+    !!! Warning ""
+        Non-array leaves are hashed by their `repr`. For objects whose `repr` includes
+        their `id` (e.g. functions), the fingerprint is only stable within a single
+        Python process.
+
+    Arguments:
+        tree: The PyTree to fingerprint. Its array leaves must not be traced.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+        max_workers: The maximum number of threads used to hash array leaves.
+
+    Returns:
+        The fingerprint, as a hex string.
+    """
+    leaves, treedef = jt.flatten(tree, is_leaf=is_leaf)
+    array_idxs = [i for i, leaf in enumerate(leaves) if eqx.is_array(leaf)]
+    array_digests = dict(zip(
+        array_idxs,
+        _array_digests([leaves[i] for i in array_idxs], max_workers=max_workers),
+    ))
+
+    h = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+    h.update(repr(treedef).encode())
+    for i, leaf in enumerate(leaves):
+        if i in array_digests:
+            h.update(b"a" + array_digests[i])
+        else:
+            h.update(f"s{type(leaf).__qualname__}:{leaf!r}".encode())
+    return h.hexdigest()
+
+
+class TreeMemoizeInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: Optional[int]
+    currsize: int
+    max_bytes: Optional[int]
+    currbytes: int
+
+
+def tree_memoize(
+    func: Optional[Callable] = None,
+    *,
+    maxsize: Optional[int] = 128,
+    max_bytes: Optional[int] = None,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+):
+    """Cache the results of a function, keyed by the fingerprints of its arguments.
+
+    This is like `functools.lru_cache`, except that the arguments may be PyTrees of
+    (unhashable) arrays. Arguments are compared with
+    [`tree_fingerprint`][jax_cookbook.tree_fingerprint], so calling the function again
+    with different arrays holding the same data is a cache hit.
+
+    Least-recently used results are evicted when there are more than `maxsize` of them,
+    or when the total size of their array leaves (by `tree_array_bytes`) exceeds
+    `max_bytes`.
+
+    !!! Example
+        ```python
+        @tree_memoize(max_bytes=2**30)
+        def analysis(results, n_bins=10):
+            ...
+        ```
+
+    Arguments:
+        func: The function to memoize.
+        maxsize: The maximum number of results to keep. If `None`, unbounded.
+        max_bytes: The maximum total bytes of array leaves over all kept results.
+            If `None`, unbounded. A single result larger than this is not cached.
+        is_leaf: Passed to `tree_fingerprint` when hashing the arguments.
+    """
+    def decorator(func: Callable):
+        cache: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        lock = threading.Lock()
+        hits = misses = currbytes = 0
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            nonlocal hits, misses, currbytes
+            key = tree_fingerprint((args, kwargs), is_leaf=is_leaf)
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    hits += 1
+                    return cache[key][0]
+                misses += 1
+
+            result = func(*args, **kwargs)
+            nbytes = tree_array_bytes(result)
+            if max_bytes is not None and nbytes > max_bytes:
+                return result
+
+            with lock:
+                if key not in cache:
+                    cache[key] = (result, nbytes)
+                    currbytes += nbytes
+                while cache and (
+                    (maxsize is not None and len(cache) > maxsize)
+                    or (max_bytes is not None and currbytes > max_bytes)
+                ):
+                    _, (_, evicted_bytes) = cache.popitem(last=False)
+                    currbytes -= evicted_bytes
+            return result
+
+        def cache_info() -> TreeMemoizeInfo:
+            with lock:
+                return TreeMemoizeInfo(
+                    hits, misses, maxsize, len(cache), max_bytes, currbytes
+                )
+
+        def cache_clear():
+            nonlocal hits, misses, currbytes
+            with lock:
+                cache.clear()
+                hits = misses = currbytes = 0
+
+        wrapper.cache_info = cache_info  # type: ignore
+        wrapper.cache_clear = cache_clear  # type: ignore
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+class TreeDedupeInfo(NamedTuple):
+    """What [`tree_dedupe`][jax_cookbook.tree_dedupe] changed.
+
+    Attributes:
+        n_arrays: The number of distinct array objects in the input tree.
+        n_duplicates: The number of array objects replaced by an equal one.
+        n_folded: The number of NumPy arrays replaced by broadcast views.
+        bytes_saved: The total bytes of array data no longer held by the tree.
+    """
+    n_arrays: int
+    n_duplicates: int
+    n_folded: int
+    bytes_saved: int
+
+
+def _bucket_key(x) -> Hashable:
+    if isinstance(x, jax.Array):
+        # Arrays on different devices are not interchangeable.
+        return ("jax", x.dtype, x.shape, x.sharding)
+    return ("numpy", np.asarray(x).dtype, np.shape(x))
+
+
+def _host_bytes(x: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(x).reshape(-1).view(np.uint8)
+
+
+def _fold_constant(x: np.ndarray) -> Optional[np.ndarray]:
+    """Return a read-only broadcast view of the first element of `x`, if all its
+    elements have the same bytes."""
+    if x.size < 2:
+        return None
+    elements = _host_bytes(x).reshape(x.size, x.dtype.itemsize)
+    if not np.all(elements == elements[0]):
+        return None
+    return np.broadcast_to(x.reshape(-1)[:1].copy().reshape(()), x.shape)
+
+
+def tree_dedupe(
+    tree: PyTree[Any, "T"],
+    fold_constants: bool = False,
+    return_info: bool = False,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+    max_workers: Optional[int] = None,
+) -> Union[PyTree[Any, "T"], tuple[PyTree[Any, "T"], TreeDedupeInfo]]:
+    """Make array leaves with equal contents share a single buffer.
+
+    Copies of the same constant arrays (masks, identity matrices, initial states,
+    etc.) no longer share memory once they have passed through e.g. `tree_stack` or
+    deserialization. This finds array leaves with the same type, dtype, shape (and,
+    for JAX arrays, sharding) whose contents are also equal, and replaces them all
+    with the first of them.
+
+    Candidates are grouped by their content hashes, as with `tree_fingerprint`, and
+    then confirmed by comparing their bytes exactly. So, e.g., `0.0` and `-0.0` are
+    not equal, while NaNs with the same bit pattern are.
+
+    !!! Warning ""
+        After deduplication, a NumPy array may appear at several places in the tree,
+        so it should not be modified in place.
+
+    Arguments:
+        tree: The PyTree to deduplicate. Its array leaves must not be traced.
+        fold_constants: If `True`, NumPy array leaves whose elements are all equal are
+            also replaced by read-only `np.broadcast_to` views of a single element.
+            JAX arrays cannot be views of other arrays, so they are not folded.
+        return_info: Whether to also return a `TreeDedupeInfo`, including the
+            number of bytes saved.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+        max_workers: The maximum number of threads used to hash array leaves.
+    """
+    leaves, treedef = jt.flatten(tree, is_leaf=is_leaf)
+
+    # Leaves that are already the same object only need to be considered once.
+    unique: dict[int, Any] = {}
+    for leaf in leaves:
+        if eqx.is_array(leaf):
+            unique.setdefault(id(leaf), leaf)
+
+    buckets: dict[Hashable, list[Any]] = {}
+    for x in unique.values():
+        buckets.setdefault(_bucket_key(x), []).append(x)
+    candidates = [x for bucket in buckets.values() if len(bucket) > 1 for x in bucket]
+    digests, host_arrays = _array_digests(
+        candidates, max_workers=max_workers, return_host_arrays=True
+    )
+
+    groups: dict[tuple[Hashable, bytes], list[tuple[Any, Optional[np.ndarray]]]] = {}
+    for x, digest, x_host in zip(candidates, digests, host_arrays):
+        groups.setdefault((_bucket_key(x), digest), []).append((x, x_host))
+
+    replacements: dict[int, Any] = {}
+    bytes_saved = 0
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        # Only the arrays whose digests were cached have not been transferred yet.
+        to_fetch = [i for i, (_, x_host) in enumerate(group) if x_host is None]
+        for i, x_host in zip(to_fetch, jax.device_get([group[i][0] for i in to_fetch])):
+            group[i] = (group[i][0], x_host)
+        remaining = group
+        # Confirm the hashes with exact comparisons; this loop only repeats in the
+        # (astronomically unlikely) case of a hash collision.
+        while len(remaining) > 1:
+            (canonical, canonical_host), rest = remaining[0], remaining[1:]
+            canonical_bytes = _host_bytes(canonical_host)
+            remaining = []
+            for x, x_host in rest:
+                if np.array_equal(_host_bytes(x_host), canonical_bytes):
+                    replacements[id(x)] = canonical
+                    bytes_saved += x.nbytes
+                else:
+                    remaining.append((x, x_host))
+
+    n_folded = 0
+    if fold_constants:
+        for key, x in unique.items():
+            if key in replacements or not isinstance(x, np.ndarray):
+                continue
+            folded = _fold_constant(x)
+            if folded is not None:
+                replacements[key] = folded
+                bytes_saved += x.nbytes - x.itemsize
+                n_folded += 1
+        # Duplicates of folded arrays share the folded view.
+        for key, x in replacements.items():
+            if id(x) in replacements and replacements[id(x)] is not x:
+                replacements[key] = replacements[id(x)]
+
+    deduped = jt.unflatten(treedef, [
+        replacements.get(id(leaf), leaf) if eqx.is_array(leaf) else leaf
+        for leaf in leaves
+    ])
+    info = TreeDedupeInfo(
+        n_arrays=len(unique),
+        n_duplicates=len(replacements) - n_folded,
+        n_folded=n_folded,
+        bytes_saved=bytes_saved,
+    )
+    if return_info:
+        return deduped, info
+    return deduped
@@ -0,0 +1,214 @@
+"""Fast selection of PyTree leaves by path."""
+
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from fnmatch import fnmatchcase
+import re
+from typing import Any, Optional
+
+import jax.tree as jt
+import jax.tree_util as jtu
+from jaxtyping import PyTree, PyTreeDef
+
+from ._tree import BuiltInKeyEntry, _node_key_to_label
+
+
+_GLOB_CHARS = frozenset("*?[")
+_REGEX_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+_REGEX_OPTIONAL_CHARS = frozenset("*?{")
+
+_INDEX_CACHE_SIZE = 256
+_INDEX_CACHE: OrderedDict[tuple[PyTreeDef, str], "TreeIndex"] = OrderedDict()
+
+_QUERY_CACHE_SIZE = 256
+
+
+class _TrieNode:
+    """A node of the tree of paths, covering the leaves `start:stop`."""
+    __slots__ = ("children", "start", "stop")
+
+    def __init__(self, start: int):
+        self.children: dict[str, _TrieNode] = {}
+        self.start = start
+        self.stop = start
+
+
+def _regex_literal_prefix(pattern: str) -> str:
+    """Return a string that every match of the regex `pattern` must start with."""
+    if "|" in pattern:
+        return ""
+    prefix = []
+    for i, char in enumerate(pattern):
+        if char in _REGEX_SPECIAL_CHARS:
+            if char in _REGEX_OPTIONAL_CHARS and prefix:
+                # The preceding character may be repeated zero times.
+                prefix.pop()
+            break
+        prefix.append(char)
+    return "".join(prefix)
+
+
+class TreeIndex:
+    """An index of the leaves of all PyTrees with a given structure, by path.
+
+    The labels of the leaves' paths (as with `tree_labels`) are arranged in a trie
+    whose nodes each cover a contiguous range of the flattened leaves. Queries walk
+    the trie, so their cost is proportional to the number of matching paths rather
+    than to the number of leaves in the tree, and their results are cached.
+
+    Build an index with [`TreeIndex.from_tree`][jax_cookbook.TreeIndex.from_tree],
+    which returns the same index for all PyTrees with the same structure.
+
+    !!! Example
+        ```python
+        index = TreeIndex.from_tree(model)
+        hidden_weights = index.where("hidden.*.weight")
+        model = eqx.tree_at(hidden_weights, model, replace_fn=lambda x: 0.1 * x)
+        trainable, frozen = eqx.partition(model, index.mask("readout.**"))
+        ```
+
+    Queries are patterns over the components of the labels:
+
+    - A component is a literal key, or a glob pattern (as with `fnmatch`), such as
+        `"*"` or `"layer_[0-3]"`;
+    - `"**"` matches any number of components, including none;
+    - Patterns that match the path of a subtree select all of its leaves; e.g.
+        `"hidden"` selects every leaf under the `hidden` node.
+
+    Alternatively, pass `regex=True` to match whole labels with a regular expression.
+    """
+
+    def __init__(
+        self,
+        paths: list[tuple[BuiltInKeyEntry, ...]],
+        treedef: PyTreeDef,
+        join_with: str = '.',
+    ):
+        self.treedef = treedef
+        self.join_with = join_with
+        self.paths = tuple(paths)
+        self.labels = tuple(
+            join_with.join(map(_node_key_to_label, path)) for path in paths
+        )
+        self._sorted_labels = sorted(
+            (label, i) for i, label in enumerate(self.labels)
+        )
+        self._sorted_label_keys = [label for label, _ in self._sorted_labels]
+        self._query_cache: OrderedDict[tuple[str, bool], tuple[int, ...]] = OrderedDict()
+
+        self._root = _TrieNode(0)
+        for i, path in enumerate(paths):
+            node = self._root
+            node.stop = i + 1
+            for key in path:
+                component = _node_key_to_label(key)
+                child = node.children.get(component)
+                if child is None:
+                    child = node.children[component] = _TrieNode(i)
+                child.stop = i + 1
+                node = child
+
+    @classmethod
+    def from_tree(
+        cls,
+        tree: PyTree[Any],
+        is_leaf: Optional[Callable[[Any], bool]] = None,
+        join_with: str = '.',
+    ) -> "TreeIndex":
+        """Return the index of the leaves of `tree`.
+
+        The index depends only on the structure of `tree`, and is cached for each
+        structure.
+
+        Arguments:
+            tree: The PyTree to index.
+            is_leaf: An optional function that decides whether each node in `tree`
+                should be treated as a leaf, or traversed as a subtree.
+            join_with: The string with which path keys are joined to form labels,
+                and on which query patterns are split into components.
+        """
+        leaves_with_path, treedef = jtu.tree_flatten_with_path(tree, is_leaf=is_leaf)
+        key = (treedef, join_with)
+        index = _INDEX_CACHE.get(key)
+        if index is not None:
+            _INDEX_CACHE.move_to_end(key)
+            return index
+        index = cls([path for path, _ in leaves_with_path], treedef, join_with)
+        _INDEX_CACHE[key] = index
+        if len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def _walk(self, node: _TrieNode, components: list[str], i: int) -> Iterator[_TrieNode]:
+        """Yield the nodes whose paths match `components[i:]`, relative to `node`."""
+        if i == len(components):
+            yield node
+            return
+        component = components[i]
+        if component == "**":
+            yield from self._walk(node, components, i + 1)
+            for child in node.children.values():
+                yield from self._walk(child, components, i)
+        elif _GLOB_CHARS.isdisjoint(component):
+            child = node.children.get(component)
+            if child is not None:
+                yield from self._walk(child, components, i + 1)
+        else:
+            for name, child in node.children.items():
+                if fnmatchcase(name, component):
+                    yield from self._walk(child, components, i + 1)
+
+    def _query(self, pattern: str, regex: bool) -> tuple[int, ...]:
+        if regex:
+            prefix = _regex_literal_prefix(pattern)
+            compiled = re.compile(pattern)
+            start = bisect_left(self._sorted_label_keys, prefix)
+            idxs = set()
+            for label, i in self._sorted_labels[start:]:
+                if not label.startswith(prefix):
+                    break
+                if compiled.fullmatch(label):
+                    idxs.add(i)
+        else:
+            components = pattern.split(self.join_with) if pattern else []
+            idxs = set()
+            for node in self._walk(self._root, components, 0):
+                idxs.update(range(node.start, node.stop))
+        return tuple(sorted(idxs))
+
+    def indices(self, pattern: str, regex: bool = False) -> tuple[int, ...]:
+        """Return the positions of the matching leaves, in the flattened tree."""
+        key = (pattern, regex)
+        idxs = self._query_cache.get(key)
+        if idxs is None:
+            idxs = self._query(pattern, regex)
+            self._query_cache[key] = idxs
+            if len(self._query_cache) > _QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return idxs
+
+    def mask(self, pattern: str, regex: bool = False) -> PyTree[bool]:
+        """Return a PyTree of bools, which is `True` for the matching leaves.
+
+        This may be used as a filter specification, e.g. with `eqx.partition`.
+        """
+        selected = [False] * len(self.labels)
+        for i in self.indices(pattern, regex):
+            selected[i] = True
+        return jt.unflatten(self.treedef, selected)
+
+    def where(self, pattern: str, regex: bool = False) -> Callable[[PyTree[Any]], list[Any]]:
+        """Return a function that returns the list of matching leaves of a PyTree with
+        the indexed structure, for use with `eqx.tree_at`."""
+        idxs = self.indices(pattern, regex)
+        treedef = self.treedef
+
+        def where_func(tree):
+            leaves = treedef.flatten_up_to(tree)
+            return [leaves[i] for i in idxs]
+
+        return where_func
@@ -0,0 +1,240 @@
+"""Estimating the memory requirements of operations, without running them."""
+
+from collections.abc import Callable, Iterator, Sequence
+import math
+from typing import Any, NamedTuple
+
+import equinox as eqx
+import jax
+import jax.extend.core as jex_core
+import jax.tree as jt
+from jaxtyping import PyTree
+
+from ._tree import tree_labels, tree_struct_bytes
+
+
+def _aval_bytes(var) -> int:
+    aval = var.aval
+    if not hasattr(aval, "shape"):
+        return 0
+    return math.prod(aval.shape) * aval.dtype.itemsize
+
+
+def _sub_jaxprs(params: dict) -> Iterator[jex_core.Jaxpr]:
+    for value in params.values():
+        values = value if isinstance(value, (tuple, list)) else (value,)
+        for v in values:
+            if isinstance(v, jex_core.ClosedJaxpr):
+                yield v.jaxpr
+            elif isinstance(v, jex_core.Jaxpr):
+                yield v
+
+
+def _jaxpr_peak_bytes(jaxpr: jex_core.Jaxpr) -> int:
+    """Estimate the peak bytes of the live values during the evaluation of a jaxpr.
+
+    Values are allocated when they are computed, and freed after their last use.
+    The inputs are assumed to be kept alive by the caller throughout. For equations
+    with sub-jaxprs (e.g. `pjit`, `scan`, `cond`), the intermediate values of the
+    sub-jaxpr are counted while the equation runs.
+
+    This does not account for the buffer reuse, fusion and rematerialization done by
+    XLA, so it is usually an overestimate of the peak memory of the compiled function.
+    """
+    return _peak_bytes(
+        set(jaxpr.invars) | set(jaxpr.constvars), jaxpr.eqns, jaxpr.outvars
+    )
+
+
+def _output_peak_bytes(jaxpr: jex_core.Jaxpr, outvar) -> int:
+    """Estimate the peak bytes of computing only one of the outputs of a jaxpr.
+
+    Only the equations that the output depends on, and the inputs that they read,
+    are counted.
+    """
+    if isinstance(outvar, jex_core.Literal):
+        return 0
+    needed = {outvar}
+    eqns = []
+    for eqn in reversed(jaxpr.eqns):
+        if any(v in needed for v in eqn.outvars):
+            eqns.append(eqn)
+            needed.update(v for v in eqn.invars if not isinstance(v, jex_core.Literal))
+    eqns.reverse()
+    inputs = {v for v in (*jaxpr.invars, *jaxpr.constvars) if v in needed}
+    return _peak_bytes(inputs, eqns, [outvar])
+
+
+def _peak_bytes(inputs: set, eqns: Sequence[jex_core.JaxprEqn], outvars) -> int:
+    last_use: dict = {}
+    for i, eqn in enumerate(eqns):
+        for v in eqn.invars:
+            if not isinstance(v, jex_core.Literal):
+                last_use[v] = i
+    for v in outvars:
+        if not isinstance(v, jex_core.Literal):
+            last_use[v] = len(eqns)
+
+    live = sum(map(_aval_bytes, inputs))
+    peak = live
+    for i, eqn in enumerate(eqns):
+        out_bytes = sum(map(_aval_bytes, eqn.outvars))
+        inner_extra = max(
+            (
+                _jaxpr_peak_bytes(sub)
+                - sum(map(_aval_bytes, sub.invars))
+                - sum(map(_aval_bytes, sub.constvars))
+                for sub in _sub_jaxprs(eqn.params)
+            ),
+            default=0,
+        )
+        live += out_bytes
+        peak = max(peak, live + max(inner_extra, 0))
+        for v in eqn.invars:
+            if (
+                not isinstance(v, jex_core.Literal)
+                and v not in inputs
+                and last_use.get(v) == i
+            ):
+                live -= _aval_bytes(v)
+        for v in eqn.outvars:
+            if v not in last_use:
+                live -= _aval_bytes(v)
+    return peak
+
+
+class MemoryPlan(NamedTuple):
+    """The estimated memory requirements of a function call.
+
+    Returned by [`plan_memory`][jax_cookbook.plan_memory].
+
+    Attributes:
+        output_struct: A PyTree of `jax.ShapeDtypeStruct` for the array outputs.
+        output_bytes: The total bytes of the array outputs.
+        output_bytes_by_path: A dict from the labels of the array outputs (as with
+            `tree_labels`) to their bytes.
+        input_bytes: The total bytes of the array inputs.
+        peak_bytes: The estimated peak bytes of the inputs, outputs, and
+            intermediate values that are alive at the same time.
+        peak_bytes_by_path: A dict from the labels of the array outputs to the
+            estimated peak bytes of computing that output alone: the inputs it
+            reads, and the intermediate values it depends on. Since intermediate
+            values may be shared between outputs, these do not sum to `peak_bytes`.
+    """
+
+    output_struct: PyTree[jax.ShapeDtypeStruct]
+    output_bytes: int
+    output_bytes_by_path: dict[str, int]
+    input_bytes: int
+    peak_bytes: int
+    peak_bytes_by_path: dict[str, int]
+
+    def check(self, budget_bytes: int):
+        """Raise a `MemoryError` if the estimated peak exceeds `budget_bytes`."""
+        if self.peak_bytes > budget_bytes:
+            largest = sorted(
+                self.peak_bytes_by_path.items(), key=lambda item: -item[1]
+            )[:5]
+            raise MemoryError(
+                f"Estimated peak memory of {self.peak_bytes:,} bytes exceeds the "
+                f"budget of {budget_bytes:,} bytes (outputs: {self.output_bytes:,} "
+                f"bytes; largest peaks by output: {largest})"
+            )
+
+
+def plan_memory(func: Callable[..., Any], *args: Any, **kwargs: Any) -> MemoryPlan:
+    """Estimate the memory needed by `func(*args, **kwargs)`, without running it.
+
+    The function is only traced, as with `jax.eval_shape`, so nothing is allocated.
+    The arguments may be arrays or `jax.ShapeDtypeStruct`s; as with `eqx.filter_jit`,
+    all other arguments are treated as static.
+
+    Besides the peak of the whole call, the peak of computing each array output alone
+    is estimated, to show which parts of the output are the most expensive. This
+    walks the traced computation once per output.
+
+    !!! Example "Pre-flight checks"
+        ```python
+        plan_memory(tree_stack, trees).check(budget_bytes=8 * 2**30)
+        plan_memory(get_ensemble, make_model, n_ensemble=100, key=key).check(budget)
+        plan_memory(vmap_multi(func, in_axes_sequence), *args).check(budget)
+        ```
+
+    Arguments:
+        func: The function to plan. This may be any cookbook operation, such as
+            `tree_stack` or `get_ensemble`, or a function returned by `vmap_multi`.
+        *args: Positional arguments to `func`.
+        **kwargs: Keyword arguments to `func`.
+    """
+    closed_jaxpr, out_struct, _ = eqx.filter_make_jaxpr(func)(*args, **kwargs)
+    out_struct_filtered = eqx.filter(
+        out_struct, lambda x: isinstance(x, jax.ShapeDtypeStruct)
+    )
+    struct_leaves = jt.leaves(out_struct_filtered)
+    jaxpr = closed_jaxpr.jaxpr
+    if struct_leaves:
+        labels = jt.leaves(tree_labels(out_struct_filtered))
+        output_bytes_by_path = {
+            label: math.prod(x.shape) * x.dtype.itemsize
+            for label, x in zip(labels, struct_leaves)
+        }
+        output_bytes = tree_struct_bytes(out_struct_filtered)
+        # The outputs of the jaxpr are the array leaves of the output, in order.
+        peak_bytes_by_path = {
+            label: _output_peak_bytes(jaxpr, outvar)
+            for label, outvar in zip(labels, jaxpr.outvars)
+        }
+    else:
+        output_bytes_by_path = {}
+        output_bytes = 0
+        peak_bytes_by_path = {}
+    return MemoryPlan(
+        output_struct=out_struct,
+        output_bytes=output_bytes,
+        output_bytes_by_path=output_bytes_by_path,
+        input_bytes=sum(map(_aval_bytes, jaxpr.invars)),
+        peak_bytes=_jaxpr_peak_bytes(jaxpr),
+        peak_bytes_by_path=peak_bytes_by_path,
+    )
+
+
+def recommend_chunk_size(
+    func: Callable[[int], Any],
+    n_total: int,
+    budget_bytes: int,
+) -> int:
+    """Recommend the largest chunk size whose estimated peak memory fits a budget.
+
+    The peak memory of `func(n)` is estimated with `plan_memory` for chunks of size
+    1 and 2, and assumed to grow linearly with the chunk size.
+
+    !!! Example
+        ```python
+        chunk_size = recommend_chunk_size(
+            lambda n: get_ensemble(make_model, n_ensemble=n, key=key),
+            n_total=1000,
+            budget_bytes=2 * 2**30,
+        )
+        ```
+
+    Arguments:
+        func: A function that performs the operation on a chunk of the given size.
+        n_total: The total number of items to process; the largest chunk size.
+        budget_bytes: The memory budget.
+
+    Raises:
+        MemoryError: If even a chunk of size 1 is not expected to fit in the budget.
+    """
+    peak_1 = plan_memory(func, 1).peak_bytes
+    if peak_1 > budget_bytes:
+        raise MemoryError(
+            f"Estimated peak memory of a single item ({peak_1:,} bytes) exceeds the "
+            f"budget of {budget_bytes:,} bytes"
+        )
+    if n_total <= 1:
+        return n_total
+    per_item = plan_memory(func, 2).peak_bytes - peak_1
+    if per_item <= 0:
+        return n_total
+    fixed = peak_1 - per_item
+    return max(1, min(n_total, (budget_bytes - fixed) // per_item))
@@ -0,0 +1,186 @@
+"""Packing the array leaves of a PyTree into one contiguous buffer per dtype."""
+
+from collections.abc import Callable
+import functools
+import operator
+from typing import Any, NamedTuple, Optional
+
+import equinox as eqx
+import jax.numpy as jnp
+import jax.tree as jt
+from jaxtyping import Array, PyTree, PyTreeDef
+
+
+class _LeafSlot(NamedTuple):
+    dtype: str
+    offset: int
+    size: int
+    shape: tuple[int, ...]
+
+
+class _PackSpec(NamedTuple):
+    treedef: PyTreeDef
+    slots: tuple[_LeafSlot, ...]
+    buffer_sizes: tuple[tuple[str, int], ...]
+
+
+@functools.lru_cache(maxsize=256)
+def _get_pack_spec(
+    treedef: PyTreeDef,
+    signature: tuple[tuple[tuple[int, ...], str], ...],
+) -> _PackSpec:
+    """Build (or retrieve) the offset and shape table for a tree of arrays."""
+    offsets: dict[str, int] = {}
+    slots = []
+    for shape, dtype in signature:
+        offset = offsets.get(dtype, 0)
+        size = functools.reduce(operator.mul, shape, 1)
+        slots.append(_LeafSlot(dtype, offset, size, shape))
+        offsets[dtype] = offset + size
+    return _PackSpec(treedef, tuple(slots), tuple(offsets.items()))
+
+
+class PackedTree(eqx.Module):
+    """The array leaves of a PyTree, stored as one flat buffer per dtype.
+
+    Construct with [`tree_pack`][jax_cookbook.tree_pack], and convert back with
+    [`tree_unpack`][jax_cookbook.tree_unpack] or `PackedTree.unpack`.
+
+    Since a `PackedTree` is itself a PyTree whose only array leaves are its buffers,
+    elementwise operations and reductions can be applied to whole buffers at once,
+    rather than leaf-by-leaf. Non-array leaves of the original tree are kept in
+    `other` and are treated as static by `eqx.filter_jit`.
+
+    Attributes:
+        buffers: A dict from dtype names to 1D buffers containing the raveled array
+            leaves of that dtype, in flattening order.
+        other: The non-array leaves of the original tree, with `None` in place of
+            its array leaves (as returned by `eqx.partition`).
+    """
+
+    buffers: dict[str, Array]
+    other: PyTree[Any]
+    _spec: _PackSpec = eqx.field(static=True)
+
+    @property
+    def treedef(self) -> PyTreeDef:
+        """The structure of the array leaves of the packed tree."""
+        return self._spec.treedef
+
+    @property
+    def num_leaves(self) -> int:
+        """The number of array leaves in the packed tree."""
+        return len(self._spec.slots)
+
+    def unpack(self) -> PyTree[Any]:
+        """Return a PyTree with the same structure as the tree that was packed."""
+        return tree_unpack(self)
+
+    def map(self, f: Callable[..., Array], *rest: "PackedTree") -> "PackedTree":
+        """Apply an elementwise function to each buffer.
+
+        Arguments:
+            f: A function that maps one or more 1D buffers to a buffer of the same
+                size. It may change the dtype of the buffer, but not its size.
+            *rest: Other `PackedTree`s with the same layout as this one, whose
+                corresponding buffers are passed as additional arguments to `f`.
+
+        Raises:
+            ValueError: If the layout of any of `rest` differs from this one; i.e. the
+                packed trees differ in structure, or in the shapes or dtypes of their
+                array leaves.
+        """
+        for i, other in enumerate(rest):
+            if other._spec != self._spec:
+                raise ValueError(
+                    f"The layout of PackedTree {i + 1} in `rest` differs from that "
+                    "of this one"
+                )
+        buffers = {
+            k: f(buf, *(other.buffers[k] for other in rest))
+            for k, buf in self.buffers.items()
+        }
+        return PackedTree(buffers, self.other, self._spec)
+
+    def reduce(
+        self,
+        f: Callable[[Array], Array],
+        combine: Callable[[Any, Any], Any] = operator.add,
+        initializer: Optional[Any] = None,
+    ) -> Any:
+        """Reduce each buffer with `f`, then combine the results across dtypes.
+
+        An `initializer` is required if the packed tree has no array leaves.
+
+        !!! Example
+            ```python
+            sum_squares = packed.reduce(lambda buf: jnp.sum(buf ** 2))
+            max_abs = packed.reduce(lambda buf: jnp.max(jnp.abs(buf)), jnp.maximum)
+            ```
+        """
+        results = [f(buf) for buf in self.buffers.values()]
+        if not results and initializer is None:
+            raise ValueError(
+                "Cannot reduce a PackedTree with no array leaves, without an "
+                "`initializer`"
+            )
+        if initializer is not None:
+            results = [initializer] + results
+        return functools.reduce(combine, results)
+
+
+def tree_pack(
+    tree: PyTree[Any, "T"],
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+) -> PackedTree:
+    """Pack the array leaves of a PyTree into one contiguous buffer per dtype.
+
+    Unlike `jax.flatten_util.ravel_pytree`, array leaves keep their dtypes. The offset
+    and shape table is cached on the structure of the tree and the shapes and dtypes
+    of its array leaves, so repeated packing of trees of the same kind is cheap,
+    including under `eqx.filter_jit`.
+
+    Non-array leaves are passed through as static data, as with
+    [`filter_wrap`][jax_cookbook.filter_wrap]. So, like the returned `PackedTree`,
+    trees with non-array leaves can only be passed through `eqx.filter_jit`, and not
+    plain `jax.jit`.
+
+    Arguments:
+        tree: The PyTree to pack.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+    """
+    arrays, other = eqx.partition(tree, eqx.is_array, is_leaf=is_leaf)
+    leaves, treedef = jt.flatten(arrays)
+    spec = _get_pack_spec(
+        treedef,
+        tuple((tuple(x.shape), jnp.dtype(x.dtype).name) for x in leaves),
+    )
+    groups: dict[str, list[Array]] = {dtype: [] for dtype, _ in spec.buffer_sizes}
+    for leaf, slot in zip(leaves, spec.slots):
+        groups[slot.dtype].append(jnp.ravel(leaf))
+    buffers = {
+        dtype: parts[0] if len(parts) == 1 else jnp.concatenate(parts)
+        for dtype, parts in groups.items()
+    }
+    return PackedTree(buffers, other, spec)
+
+
+def tree_unpack(packed: PackedTree) -> PyTree[Any]:
+    """Return the PyTree that was packed into a `PackedTree`.
+
+    Each array leaf is a reshaped slice of the buffer for its dtype. Under
+    `eqx.filter_jit`, these slices are fused into their consumers rather than copied.
+    (Plain `jax.jit` only works if the packed tree has no non-array leaves, which
+    are static.)
+    """
+    spec = packed._spec
+    leaves = [
+        jnp.reshape(
+            packed.buffers[slot.dtype][slot.offset : slot.offset + slot.size],
+            slot.shape,
+        )
+        for slot in spec.slots
+    ]
+    arrays = jt.unflatten(spec.treedef, leaves)
+    return eqx.combine(arrays, packed.other)
@@ -0,0 +1,183 @@
+"""Deferred sequences of per-leaf operations on a PyTree, flattened only once."""
+
+from collections.abc import Callable, Hashable
+import functools
+from typing import Any, NamedTuple, Optional
+
+import equinox as eqx
+import jax.numpy as jnp
+import jax.tree as jt
+from jaxtyping import ArrayLike, PyTree, PyTreeDef
+
+from ._func import compose
+
+
+class _Step(NamedTuple):
+    kind: str
+    # Hashable description of the step, which is part of the key of the plan cache.
+    static: Hashable
+    # Data that is passed into the (possibly jitted) body of the plan, e.g. indices.
+    operand: Any = None
+
+
+class _Stage(NamedTuple):
+    kind: str
+    static: Hashable
+    operand_idx: int
+
+
+def _fuse_steps(steps: tuple[tuple[str, Hashable], ...]) -> list[_Stage]:
+    """Compose each run of consecutive map steps into a single function."""
+    stages: list[_Stage] = []
+    for i, (kind, static) in enumerate(steps):
+        if kind == "map" and stages and stages[-1].kind == "map":
+            stages[-1] = _Stage("map", compose(stages[-1].static, static), -1)
+        else:
+            stages.append(_Stage(kind, static, i))
+    return stages
+
+
+def _apply_stages(stages: list[_Stage], leaf: Any, operands: tuple) -> Any:
+    for stage in stages:
+        if leaf is None:
+            break
+        if stage.kind == "map":
+            leaf = stage.static(leaf)
+        elif stage.kind == "filter":
+            filter_spec, inverse = stage.static
+            if bool(filter_spec(leaf)) == inverse:
+                leaf = None
+        elif stage.kind == "take":
+            axis, kwargs = stage.static
+            if eqx.is_array(leaf):
+                leaf = jnp.take(leaf, operands[stage.operand_idx], axis=axis, **dict(kwargs))
+    return leaf
+
+
+@functools.lru_cache(maxsize=128)
+def _build_plan(
+    treedef: PyTreeDef,
+    steps: tuple[tuple[str, Hashable], ...],
+    reduce_func: Optional[Callable[[Any, Any], Any]],
+    jit: bool,
+) -> Callable[[list, tuple, Any], Any]:
+    stages = _fuse_steps(steps)
+
+    def body(leaves, operands, initializer):
+        results = [_apply_stages(stages, leaf, operands) for leaf in leaves]
+        if reduce_func is None:
+            return jt.unflatten(treedef, results)
+        results = [x for x in results if x is not None]
+        if initializer is not None:
+            results = [initializer] + results
+        return functools.reduce(reduce_func, results)
+
+    if jit:
+        return eqx.filter_jit(body)
+    return body
+
+
+class TreePipeline:
+    """A deferred sequence of map, filter, take and reduce steps over a PyTree.
+
+    Chaining `jt.map`, `eqx.filter` and `tree_take` flattens and unflattens the tree
+    once per call. A `TreePipeline` flattens the tree once when it is constructed,
+    records each step, and only applies them when `compute` is called: each leaf is
+    passed through all the steps in turn, and consecutive map steps are composed into
+    a single function.
+
+    The plan for a pipeline is cached on the structure of the tree and on the recorded
+    steps, so repeating a pipeline over trees with the same structure -- using the same
+    function objects -- reuses the plan, including its compiled body when `jit=True`.
+
+    !!! Example
+        ```python
+        result = (
+            TreePipeline(tree, jit=True)
+            .filter(eqx.is_array)
+            .map(jnp.abs)
+            .take(jnp.arange(10), axis=1)
+            .map(jnp.mean)
+            .compute()
+        )
+        ```
+
+    !!! Note ""
+        Every step is applied leaf-by-leaf to the leaves of the original tree. If a map
+        step returns a PyTree for some leaf, later steps will receive that PyTree as a
+        single argument, rather than being mapped over its leaves.
+
+    Arguments:
+        tree: The PyTree to operate on.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+        jit: Whether to `eqx.filter_jit` the fused body of the pipeline.
+    """
+
+    def __init__(
+        self,
+        tree: PyTree[Any, "T"],
+        is_leaf: Optional[Callable[[Any], bool]] = None,
+        jit: bool = False,
+    ):
+        self._leaves, self._treedef = jt.flatten(tree, is_leaf=is_leaf)
+        self._jit = jit
+        self._steps: tuple[_Step, ...] = ()
+        self._reduce: Optional[tuple[Callable, Any]] = None
+
+    def _copy(self) -> "TreePipeline":
+        if self._reduce is not None:
+            raise ValueError("Cannot add steps to a pipeline after `reduce`")
+        pipeline = object.__new__(TreePipeline)
+        pipeline.__dict__.update(self.__dict__)
+        return pipeline
+
+    def _with_step(self, step: _Step) -> "TreePipeline":
+        pipeline = self._copy()
+        pipeline._steps = self._steps + (step,)
+        return pipeline
+
+    def map(self, f: Callable[[Any], Any]) -> "TreePipeline":
+        """Apply `f` to each leaf that has not been filtered out."""
+        return self._with_step(_Step("map", f))
+
+    def filter(
+        self, filter_spec: Callable[[Any], bool], inverse: bool = False,
+    ) -> "TreePipeline":
+        """Replace leaves that do not satisfy `filter_spec` with `None`, as with
+        `eqx.filter`.
+
+        Unlike `eqx.filter`, `filter_spec` must be a callable.
+        """
+        return self._with_step(_Step("filter", (filter_spec, inverse)))
+
+    def take(
+        self, indices: ArrayLike, axis: int = 0, **kwargs: Any,
+    ) -> "TreePipeline":
+        """Index elements out of one axis of each array leaf, as with `tree_take`."""
+        return self._with_step(
+            _Step("take", (axis, tuple(sorted(kwargs.items()))), indices)
+        )
+
+    def reduce(
+        self, f: Callable[[Any, Any], Any], initializer: Optional[Any] = None,
+    ) -> "TreePipeline":
+        """Reduce the remaining leaves with `f`, as with `jt.reduce`.
+
+        This must be the final step of the pipeline.
+        """
+        pipeline = self._copy()
+        pipeline._reduce = (f, initializer)
+        return pipeline
+
+    def compute(self) -> Any:
+        """Apply the recorded steps, and return the resulting PyTree (or reduction)."""
+        reduce_func, initializer = self._reduce or (None, None)
+        plan = _build_plan(
+            self._treedef,
+            tuple((step.kind, step.static) for step in self._steps),
+            reduce_func,
+            self._jit,
+        )
+        operands = tuple(step.operand for step in self._steps)
+        return plan(list(self._leaves), operands, initializer)
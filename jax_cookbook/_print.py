@@ -1,16 +1,27 @@
+"""Printing and comparing summaries of PyTrees."""
 
+from collections.abc import Callable, Hashable, Iterator
 import difflib
+import itertools
 from itertools import zip_longest
 import textwrap
+from typing import Any, NamedTuple, Optional, Tuple
 
 import equinox as eqx
+import jax
+import jax.numpy as jnp
+import jax.tree as jt
+
+from ._tree import _flatten_one_level_with_keys, _node_key_to_label
 
 
 def highlight_string_diff(obj1, obj2):
     """Given two objects, give a string that highlights the differences in
     their string representations.
 
-    This can be useful for identifying slight differences in large PyTrees.
+    This can be useful for identifying slight differences in PyTrees. However, its
+    cost grows quadratically with the length of the `repr`s; for large PyTrees, use
+    [`tree_diff`][jax_cookbook.tree_diff] instead.
 
     Source: https://stackoverflow.com/a/76946768
     """
@@ -27,34 +38,257 @@ def highlight_string_diff(obj1, obj2):
         str2_new += f"\033[91m{str2[m.b:m.b + m.size]}\033[0m"
         i = m.b + m.size
 
-    return str2_new.replace('\\n', '\n')
+    return str2_new.replace("\\n", "\n")
 
 
-def print_trees_side_by_side(tree1, tree2, column_width=60, separator='|'):
-    """Given two PyTrees, print their pretty representations side-by-side."""
-    strs1 = eqx.tree_pformat(tree1).split('\n')
-    strs2 = eqx.tree_pformat(tree2).split('\n')
+class _SummaryRow(NamedTuple):
+    path: tuple
+    depth: int
+    text: str
+    array: Any = None
+
+
+def _array_summary(x) -> str:
+    return f"{jnp.dtype(x.dtype).name}{list(x.shape)}"
+
+
+def _truncated_repr(x: Any, max_len: int = 60) -> str:
+    s = repr(x)
+    if len(s) > max_len:
+        s = s[: max_len - 3] + "..."
+    return s
+
+
+def _summary_signature(
+    node: Any, is_leaf: Optional[Callable[[Any], bool]]
+) -> Optional[Hashable]:
+    """Returns a key shared by sibling nodes that can be collapsed into one row."""
+    leaves, treedef = jt.flatten(node, is_leaf=is_leaf)
+    if not all(eqx.is_array(leaf) for leaf in leaves):
+        return None
+    return (type(node), treedef, tuple((x.shape, x.dtype) for x in leaves))
+
+
+def _summary_rows(
+    tree: Any,
+    max_depth: Optional[int],
+    max_leaves: Optional[int],
+    is_leaf: Optional[Callable[[Any], bool]],
+) -> Iterator[_SummaryRow]:
+    n_leaves = 0
+    elided = False
+
+    def walk(node, name, path, depth):
+        nonlocal n_leaves, elided
+        flat = _flatten_one_level_with_keys(node, is_leaf)
+        if flat is None:
+            n_leaves += 1
+            if eqx.is_array(node):
+                yield _SummaryRow(path, depth, f"{name}{_array_summary(node)}", node)
+            else:
+                yield _SummaryRow(path, depth, f"{name}{_truncated_repr(node)}")
+            return
+
+        children, _ = flat
+        type_name = type(node).__name__
+        if max_depth is not None and depth >= max_depth:
+            yield _SummaryRow(
+                path, depth, f"{name}{type_name}(... {len(children)} children)"
+            )
+            return
+        yield _SummaryRow(path, depth, f"{name}{type_name}")
+
+        # Signatures are computed only for the children that are reached, since each
+        # flattens a whole subtree.
+        signatures: dict[int, Optional[Hashable]] = {}
+
+        def signature(k: int) -> Optional[Hashable]:
+            if k not in signatures:
+                signatures[k] = _summary_signature(children[k][1], is_leaf)
+            return signatures[k]
+
+        def same_group(i: int, j: int) -> bool:
+            if type(children[i][1]) is not type(children[j][1]):
+                return False
+            return signature(i) is not None and signature(j) == signature(i)
+
+        i = 0
+        while i < len(children) and not elided:
+            if max_leaves is not None and n_leaves >= max_leaves:
+                elided = True
+                yield _SummaryRow(path + ("...",), depth + 1, "...")
+                return
+            j = i + 1
+            while j < len(children) and same_group(i, j):
+                j += 1
+            key, child = children[i]
+            if j - i > 1:
+                last_key = children[j - 1][0]
+                if eqx.is_array(child):
+                    desc = _array_summary(child)
+                else:
+                    desc = type(child).__name__
+                n_leaves += 1
+                yield _SummaryRow(
+                    path + (key,),
+                    depth + 1,
+                    f"{_node_key_to_label(key)}..{_node_key_to_label(last_key)}: "
+                    f"\u00d7{j - i} {desc}",
+                )
+            else:
+                yield from walk(
+                    child, f"{_node_key_to_label(key)}: ", path + (key,), depth + 1
+                )
+            i = j
+
+    yield from walk(tree, "", (), 0)
+
+
+@jax.jit
+def _array_stats(arrays):
+    stats = []
+    for x in arrays:
+        x = x.astype(jnp.promote_types(x.dtype, jnp.float32))
+        if jnp.issubdtype(x.dtype, jnp.complexfloating):
+            x = jnp.abs(x)
+        stats.append(jnp.stack([jnp.mean(x), jnp.std(x), jnp.min(x), jnp.max(x)]))
+    return jnp.stack(stats)
 
-    def wrap_text(text, width):
-        return textwrap.wrap(text, width) or ['']
 
-    wrapped1 = [wrap_text(s, column_width) for s in strs1]
-    wrapped2 = [wrap_text(s, column_width) for s in strs2]
+def _summary_lines_with_paths(
+    tree: Any,
+    max_depth: Optional[int],
+    max_leaves: Optional[int],
+    stats: bool,
+    is_leaf: Optional[Callable[[Any], bool]],
+    indent: int,
+    chunk_size: int = 256,
+) -> Iterator[Tuple[tuple, str]]:
+    rows = _summary_rows(tree, max_depth, max_leaves, is_leaf)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        stats_by_row = {}
+        if stats:
+            idxs = [
+                i
+                for i, row in enumerate(chunk)
+                if row.array is not None and row.array.size > 0
+            ]
+            if idxs:
+                values = jax.device_get(_array_stats([chunk[i].array for i in idxs]))
+                stats_by_row = dict(zip(idxs, values))
+        for i, row in enumerate(chunk):
+            line = " " * (indent * row.depth) + row.text
+            if i in stats_by_row:
+                mean, std, min_, max_ = stats_by_row[i]
+                line += f" \u03bc={mean:.3g} \u03c3={std:.3g} [{min_:.3g}, {max_:.3g}]"
+            yield row.path, line
 
-    for w1, w2 in zip_longest(wrapped1, wrapped2, fillvalue=['']):
-        max_lines = max(len(w1), len(w2))
 
-        for i in range(max_lines):
-            line1 = w1[i] if i < len(w1) else ''
-            line2 = w2[i] if i < len(w2) else ''
+def tree_summary_lines(
+    tree: Any,
+    max_depth: Optional[int] = 4,
+    max_leaves: Optional[int] = 100,
+    stats: bool = True,
+    indent: int = 2,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+) -> Iterator[str]:
+    """Yields the lines of a summarized, indented representation of a PyTree.
+
+    Unlike `eqx.tree_pformat`, the cost of this is proportional to what is shown:
+
+    - Nodes deeper than `max_depth` are shown as a single line with their type and
+      number of children.
+    - After `max_leaves` leaves (or collapsed groups) have been shown, the rest of the
+      tree is elided.
+    - Consecutive siblings with the same structure, array shapes and dtypes are
+      collapsed into a single line, e.g. `0..63: ×64 Linear`.
+    - Lines are generated lazily. Array statistics are computed in a single batched
+      reduction for each chunk of lines.
+
+    Arguments:
+        tree: The PyTree to summarize.
+        max_depth: The maximum depth of nodes to expand. If `None`, all nodes are
+            expanded.
+        max_leaves: The maximum number of leaves (or collapsed groups) to show. If
+            `None`, all leaves are shown.
+        stats: Whether to show the mean, standard deviation, minimum and maximum of
+            each array leaf.
+        indent: The number of spaces to indent each level of the tree.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+    """
+    for _, line in _summary_lines_with_paths(
+        tree, max_depth, max_leaves, stats, is_leaf, indent
+    ):
+        yield line
+
+
+def print_tree_summary(tree: Any, **kwargs: Any):
+    """Print a summary of a PyTree.
+
+    Keyword arguments are passed to `tree_summary_lines`.
+    """
+    for line in tree_summary_lines(tree, **kwargs):
+        print(line)
+
+
+def print_trees_side_by_side(
+    tree1,
+    tree2,
+    column_width=60,
+    separator="|",
+    max_depth: Optional[int] = 4,
+    max_leaves: Optional[int] = 100,
+    stats: bool = False,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+):
+    """Given two PyTrees, print their summarized representations side-by-side.
+
+    Rows are aligned by their path in the trees, rather than by line number, so that
+    a node present in only one of the trees does not shift the rest of the rows. See
+    `tree_summary_lines` for the meaning of the other arguments; in particular, pass
+    `max_depth=None, max_leaves=None` to show the trees in full. Rows longer than
+    `column_width` are wrapped, with continuation lines indented under their row.
+    """
+    rows1, rows2 = (
+        list(_summary_lines_with_paths(tree, max_depth, max_leaves, stats, is_leaf, 2))
+        for tree in (tree1, tree2)
+    )
+
+    def wrap_text(text, width):
+        stripped = text.lstrip(" ")
+        indent = " " * min(len(text) - len(stripped), width // 2)
+        return textwrap.wrap(
+            stripped, width, initial_indent=indent, subsequent_indent=indent + "  "
+        ) or [""]
+
+    def print_row(text1, text2):
+        w1, w2 = wrap_text(text1, column_width), wrap_text(text2, column_width)
+        for line1, line2 in zip_longest(w1, w2, fillvalue=""):
             print(f"{line1:<{column_width}} {separator} {line2:<{column_width}}")
-            
-            
+
+    matcher = difflib.SequenceMatcher(
+        None,
+        [path for path, _ in rows1],
+        [path for path, _ in rows2],
+        autojunk=False,
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for (_, text1), (_, text2) in zip(rows1[i1:i2], rows2[j1:j2]):
+                print_row(text1, text2)
+        else:
+            for _, text1 in rows1[i1:i2]:
+                print_row(text1, "")
+            for _, text2 in rows2[j1:j2]:
+                print_row("", text2)
+
+
 def _simple_module_pprint(name, *children, **kwargs):
     return bracketed(
         pp.text(name),
-        kwargs['indent'],
+        kwargs["indent"],
         [tree_pp(child, **kwargs) for child in children],
-        '(',
-        ')'
-    )
\ No newline at end of file
+        "(",
+        ")",
+    )
@@ -1,20 +1,182 @@
-from functools import partial
+from collections.abc import Callable
+from functools import cache, wraps
 import os
 import sys
+import threading
+import time
+from typing import Any, Optional
+
+import jax
+import numpy as np
 
 
 tqdm_mode = os.environ.get("FEEDBAX_TQDM", "auto")
 
 
-# match tqdm_mode:
-#     case "notebook":
-#         from tqdm.notebook import tqdm as _tqdm
-#     case "cli" | "console":
-#         from tqdm import tqdm as _tqdm
-#         _tqdm_write = partial(_tqdm.write, file=sys.stderr, end="")
-#     case "auto" | _:
-#         from tqdm.auto import tqdm as _tqdm
-#         _tqdm_write = partial(_tqdm.write, file=sys.stdout, end="")
+@cache
+def _get_tqdm():
+    # Importing `tqdm.auto` is slow, so defer it until a progress bar is needed.
+    if tqdm_mode == "notebook":
+        from tqdm.notebook import tqdm
+    elif tqdm_mode in ("cli", "console"):
+        from tqdm import tqdm
+    else:
+        from tqdm.auto import tqdm
+    return tqdm
+
+
+def _tqdm(*args, **kwargs):
+    return _get_tqdm()(*args, **kwargs)
+
+
+def _tqdm_write(s: str):
+    file = sys.stderr if tqdm_mode in ("cli", "console") else sys.stdout
+    _get_tqdm().write(s, file=file, end="")
+
+
+class _HostProgressBar:
+    """Host-side state of a progress bar that is updated from inside JAX transformations.
+
+    Updates set the bar to an absolute iteration count rather than incrementing it,
+    so repeated callbacks for the same iteration (e.g. under `vmap`) are harmless.
+    The bar is created when the first update of a run arrives, and closed after the
+    final iteration.
+    """
+
+    def __init__(
+        self,
+        total: int,
+        every_seconds: float,
+        **tqdm_kwargs: Any,
+    ):
+        self.total = total
+        self.every_seconds = every_seconds
+        self.tqdm_kwargs = tqdm_kwargs
+        self._pbar = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, i):
+        n = int(np.max(i)) + 1
+        with self._lock:
+            if self._pbar is None or n < self._pbar.n:
+                # A new run of the loop has started.
+                if self._pbar is not None:
+                    self._pbar.close()
+                self._pbar = _tqdm(total=self.total, **self.tqdm_kwargs)
+                self._last_refresh = 0.0
+            now = time.monotonic()
+            if n < self.total and now - self._last_refresh < self.every_seconds:
+                return
+            self._last_refresh = now
+            if n > self._pbar.n:
+                self._pbar.update(n - self._pbar.n)
+            if n >= self.total:
+                self._pbar.close()
+                self._pbar = None
+
+
+def _make_progress_tick(
+    n: int,
+    every: Optional[int],
+    every_seconds: float,
+    desc: Optional[str],
+    position: Optional[int],
+    leave: Optional[bool],
+) -> Callable[[Any], None]:
+    if every is None:
+        every = max(1, n // 100)
+    bar = _HostProgressBar(
+        n, every_seconds, desc=desc, position=position, leave=leave,
+    )
+
+    def tick(i):
+        # Decided on device, so the host is only called back every `every` iterations.
+        jax.lax.cond(
+            (i % every == 0) | (i == n - 1),
+            lambda i: jax.debug.callback(bar.update, i),
+            lambda i: None,
+            i,
+        )
+
+    return tick
+
+
+def scan_tqdm(
+    n: int,
+    every: Optional[int] = None,
+    every_seconds: float = 0.1,
+    desc: Optional[str] = None,
+    position: Optional[int] = None,
+    leave: Optional[bool] = None,
+) -> Callable[[Callable], Callable]:
+    """Returns a decorator that adds a progress bar to the body of a `lax.scan`.
+
+    The progress bar is updated through `jax.debug.callback`, so the decorated body
+    may be used inside `jit`, `vmap`, etc. Whether to call back to the host is
+    decided on device, every `every` iterations; the host then redraws the bar at most
+    once every `every_seconds`.
+
+    The body must be scanned over the iteration indices: its second argument must be
+    either the index of the current iteration, or a tuple whose first element is.
+
+    !!! Example
+        ```python
+        @scan_tqdm(n_steps)
+        def step(state, x):
+            i, inputs = x
+            ...
+            return state, output
+
+        state, outputs = jax.lax.scan(step, init, (jnp.arange(n_steps), inputs))
+        ```
+
+    !!! Note ""
+        To nest a scan progress bar inside another bar -- e.g. when the scan runs
+        inside `tree_map_tqdm` -- pass `position=1, leave=False`.
+
+    Arguments:
+        n: The number of iterations of the scan.
+        every: Report progress to the host every `every` iterations. Defaults to
+            about 1% of `n`.
+        every_seconds: The minimum time between redraws of the bar.
+        desc: The description shown on the bar.
+        position: The line on which to show the bar, as with `tqdm`.
+        leave: Whether to keep the bar after the scan finishes, as with `tqdm`.
+    """
+    tick = _make_progress_tick(n, every, every_seconds, desc, position, leave)
+
+    def decorator(body: Callable) -> Callable:
+        @wraps(body)
+        def wrapper(carry, x):
+            tick(x[0] if isinstance(x, tuple) else x)
+            return body(carry, x)
+        return wrapper
+
+    return decorator
+
+
+def loop_tqdm(
+    n: int,
+    every: Optional[int] = None,
+    every_seconds: float = 0.1,
+    desc: Optional[str] = None,
+    position: Optional[int] = None,
+    leave: Optional[bool] = None,
+) -> Callable[[Callable], Callable]:
+    """Returns a decorator that adds a progress bar to the body of a `lax.fori_loop`.
+
+    The same as [`scan_tqdm`][jax_cookbook.scan_tqdm], except that the decorated body
+    has the signature `body(i, val)` of a `fori_loop` body, and the loop should run
+    from `0` to `n`.
+    """
+    tick = _make_progress_tick(n, every, every_seconds, desc, position, leave)
+
+    def decorator(body: Callable) -> Callable:
+        @wraps(body)
+        def wrapper(i, val):
+            tick(i)
+            return body(i, val)
+        return wrapper
 
-from tqdm.auto import tqdm as _tqdm
-_tqdm_write = partial(_tqdm.write, file=sys.stdout, end="")
\ No newline at end of file
+    return decorator
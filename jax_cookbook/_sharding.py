@@ -0,0 +1,125 @@
+"""Placing the leaves of PyTrees across multiple devices."""
+
+from collections.abc import Callable
+from typing import Any, Optional
+
+import equinox as eqx
+import jax
+import jax.tree as jt
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
+from jaxtyping import PyTree
+import numpy as np
+
+
+def _default_mesh(axis_name: str = 'batch') -> Mesh:
+    """Return a one-dimensional mesh over all the available devices."""
+    return Mesh(np.array(jax.devices()), (axis_name,))
+
+
+def _broadcast_prefix(
+    prefix: PyTree[Any],
+    tree: PyTree[Any],
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+) -> list[Any]:
+    """Return the value of the prefix tree `prefix` for each leaf of `tree`."""
+    result = []
+    jt.map(
+        lambda p, subtree: result.extend([p] * len(jt.leaves(subtree, is_leaf=is_leaf))),
+        prefix,
+        tree,
+        is_leaf=lambda x: x is None,
+    )
+    return result
+
+
+def tree_shard(
+    tree: PyTree[Any, "T"],
+    axes: PyTree[Optional[int]] = 0,
+    mesh: Optional[Mesh] = None,
+    axis_name: str = 'batch',
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+) -> PyTree[Any, "T"]:
+    """Split the array leaves of a PyTree along one of their axes, across devices.
+
+    Each array leaf is placed with a `NamedSharding` over `mesh`, which splits the
+    leaf's axis given by `axes` along the mesh axis `axis_name`. Array leaves whose
+    axis is `None` are replicated on all the devices of the mesh, as are scalar
+    (0-d) array leaves, which have no axis to split. Non-array leaves are returned
+    unchanged.
+
+    !!! Example "Spreading an ensemble across host devices"
+        ```python
+        # e.g. with XLA_FLAGS=--xla_force_host_platform_device_count=8
+        models = get_ensemble(make_model, n_ensemble=8, key=key)
+        models = tree_shard(models)  # Split the ensemble axis across devices.
+        outputs = eqx.filter_vmap(run)(models, inputs)
+        outputs = tree_gather(outputs, to_host=True)
+        ```
+
+    Arguments:
+        tree: The PyTree to place.
+        axes: A prefix tree of `tree`, as for the `in_axes` of `jax.vmap`, giving the
+            axis of each leaf to split, or `None` for leaves to replicate.
+        mesh: The device mesh. Defaults to a one-dimensional mesh over all the
+            available devices, whose axis is named `axis_name`.
+        axis_name: The mesh axis along which to split the leaves.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+
+    Raises:
+        ValueError: If a leaf's axis is not divisible by the size of the mesh axis.
+    """
+    if mesh is None:
+        mesh = _default_mesh(axis_name)
+    n_shards = mesh.shape[axis_name]
+
+    leaves, treedef = jt.flatten(tree, is_leaf=is_leaf)
+    leaf_axes = _broadcast_prefix(axes, tree, is_leaf=is_leaf)
+    replicated = NamedSharding(mesh, PartitionSpec())
+
+    idxs, arrays, shardings = [], [], []
+    for i, (leaf, axis) in enumerate(zip(leaves, leaf_axes)):
+        if not eqx.is_array(leaf):
+            continue
+        if axis is None or leaf.ndim == 0:
+            sharding = replicated
+        else:
+            axis = axis % leaf.ndim
+            if leaf.shape[axis] % n_shards:
+                raise ValueError(
+                    f"Axis {axis} of a leaf with shape {leaf.shape} is not divisible "
+                    f"by the size of mesh axis '{axis_name}' ({n_shards})"
+                )
+            sharding = NamedSharding(mesh, PartitionSpec(*[None] * axis, axis_name))
+        idxs.append(i)
+        arrays.append(leaf)
+        shardings.append(sharding)
+
+    # Place all the leaves in a single call.
+    for i, placed in zip(idxs, jax.device_put(arrays, shardings)):
+        leaves[i] = placed
+    return jt.unflatten(treedef, leaves)
+
+
+def tree_gather(
+    tree: PyTree[Any, "T"],
+    device: Optional[jax.Device] = None,
+    to_host: bool = False,
+) -> PyTree[Any, "T"]:
+    """Bring the array leaves of a PyTree, which may be sharded, onto one device.
+
+    This is the inverse of [`tree_shard`][jax_cookbook.tree_shard].
+
+    Arguments:
+        tree: The PyTree to gather.
+        device: The device on which to place the leaves. Defaults to the first
+            available device.
+        to_host: If `True`, the leaves are transferred to the host as NumPy arrays,
+            instead of to a device.
+    """
+    arrays, other = eqx.partition(tree, eqx.is_array)
+    if to_host:
+        arrays = jax.device_get(arrays)
+    else:
+        arrays = jax.device_put(arrays, device if device is not None else jax.devices()[0])
+    return eqx.combine(arrays, other)
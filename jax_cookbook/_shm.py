@@ -0,0 +1,281 @@
+"""Passing PyTrees of arrays between processes through shared memory."""
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+import sys
+from typing import Any, Optional
+import weakref
+
+import equinox as eqx
+import jax
+import jax.numpy as jnp
+import jax.tree as jt
+from jaxtyping import PyTree
+import numpy as np
+
+
+# Offsets of arrays in a segment are aligned to cache lines.
+_ALIGNMENT = 64
+
+# Names of the segments created by this process, with `tree_to_shared`.
+_created_segments: set[str] = set()
+
+
+@dataclass(frozen=True)
+class _ArraySlot:
+    """The location of an array in a shared memory segment."""
+    offset: int
+    shape: tuple[int, ...]
+    # The name of the dtype, which unlike `dtype.str` also identifies extended dtypes
+    # such as bfloat16, whose `str` is that of raw bytes (e.g. `'<V2'`).
+    dtype: str
+
+
+def _attach_segment(name: str, owner: bool = False) -> shared_memory.SharedMemory:
+    """Open an existing segment.
+
+    If `owner` is `True`, this process becomes responsible for unlinking the segment,
+    and it is registered with the resource tracker so that `unlink` unregisters it.
+    Otherwise, the segment is left registered only with the tracker of the process
+    that created it, so that it is not unlinked when this process exits.
+    """
+    if owner:
+        return shared_memory.SharedMemory(name=name)
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Before Python 3.13, opening a segment always registers it. Processes started by
+    # `multiprocessing` share the tracker of their parent, which already holds the
+    # registration of the creator, so the duplicate is harmless there -- whereas
+    # unregistering it would drop the creator's registration. Any other process has
+    # its own tracker, which would unlink the segment when the process exits.
+    shm = shared_memory.SharedMemory(name=name)
+    if multiprocessing.parent_process() is None and name not in _created_segments:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink_segment(shm: shared_memory.SharedMemory):
+    # Unlinking does not unmap the segment, so this is safe while views exist.
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+    _created_segments.discard(shm.name)
+
+
+class _SegmentMapping:
+    """Keeps a segment mapped into this process while any views of it exist.
+
+    Each view's base is a `_SharedArrayView`, which references this object, which
+    owns the `SharedMemory`. The segment is unmapped once all of them are garbage
+    collected, rather than by an explicit `close`, which would leave the views
+    pointing at unmapped memory.
+    """
+    __slots__ = ("shm", "address")
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        self.address = np.frombuffer(shm.buf, np.uint8).ctypes.data
+
+
+class _SharedArrayView:
+    __slots__ = ("_mapping", "__array_interface__")
+
+    def __init__(self, mapping: _SegmentMapping, slot: _ArraySlot):
+        self._mapping = mapping
+        self.__array_interface__ = dict(
+            version=3,
+            shape=slot.shape,
+            typestr=jnp.dtype(slot.dtype).str,
+            data=(mapping.address + slot.offset, False),
+        )
+
+
+def _view(mapping: _SegmentMapping, slot: _ArraySlot) -> np.ndarray:
+    x = np.asarray(_SharedArrayView(mapping, slot))
+    dtype = jnp.dtype(slot.dtype)
+    return x if x.dtype == dtype else x.view(dtype)
+
+
+def _views(
+    mapping: _SegmentMapping,
+    tree: PyTree[Any],
+) -> PyTree[Any]:
+    return jt.map(
+        lambda x: _view(mapping, x) if isinstance(x, _ArraySlot) else x,
+        tree,
+        is_leaf=lambda x: isinstance(x, _ArraySlot),
+    )
+
+
+def _copy_arrays(tree: PyTree[Any]) -> PyTree[Any]:
+    return jt.map(lambda x: x.copy() if isinstance(x, np.ndarray) else x, tree)
+
+
+@dataclass(frozen=True)
+class SharedTreeHandle:
+    """A small, picklable reference to a PyTree stored in shared memory.
+
+    Send this to other processes in place of the PyTree itself. Returned by
+    [`tree_to_shared`][jax_cookbook.tree_to_shared], as `SharedTree.handle`.
+
+    Attributes:
+        name: The name of the shared memory segment.
+        nbytes: The size of the array data in the segment.
+        tree: The PyTree, whose array leaves have been replaced by their locations
+            in the segment.
+    """
+
+    name: str
+    nbytes: int
+    tree: PyTree[Any]
+
+    @contextmanager
+    def attach(self) -> Iterator[PyTree[Any]]:
+        """Context manager that yields the PyTree, whose array leaves are zero-copy
+        NumPy views of the shared memory.
+
+        The segment stays mapped into this process for as long as any of the views
+        are referenced, including after the context exits. Writes to the views are
+        visible to all processes. If the owner destroys the segment, views that are
+        still referenced remain valid, but no longer shared.
+        """
+        yield _views(_SegmentMapping(_attach_segment(self.name)), self.tree)
+
+    def load(self, unlink: bool = False) -> PyTree[Any]:
+        """Return a copy of the PyTree, whose array leaves are NumPy arrays.
+
+        Arguments:
+            unlink: If `True`, the segment is destroyed after it is copied. Use this
+                to receive a result sent with `SharedTree.transfer`.
+        """
+        mapping = _SegmentMapping(_attach_segment(self.name, owner=unlink))
+        try:
+            return _copy_arrays(_views(mapping, self.tree))
+        finally:
+            if unlink:
+                _unlink_segment(mapping.shm)
+
+    def claim(self) -> "SharedTree":
+        """Take ownership of the segment, which is destroyed when the returned
+        `SharedTree` is closed. Use this to receive a result sent with
+        `SharedTree.transfer`, without copying it."""
+        return SharedTree(_attach_segment(self.name, owner=True), self)
+
+
+class SharedTree:
+    """Owns a shared memory segment that holds the array leaves of a PyTree.
+
+    The segment is destroyed when `close` is called, when the context of a `with`
+    statement exits, or when this object is garbage collected. Segments created by
+    processes that crash are destroyed by the `multiprocessing` resource tracker.
+    Destroying the segment does not unmap it from this process while views of it
+    are still referenced.
+
+    Attributes:
+        handle: The picklable `SharedTreeHandle`, to send to other processes.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, handle: SharedTreeHandle):
+        self.handle = handle
+        self._mapping = _SegmentMapping(shm)
+        self._finalizer = weakref.finalize(self, _unlink_segment, shm)
+
+    @contextmanager
+    def attach(self) -> Iterator[PyTree[Any]]:
+        """Context manager that yields zero-copy views of the PyTree; see
+        `SharedTreeHandle.attach`."""
+        yield _views(self._mapping, self.handle.tree)
+
+    def load(self) -> PyTree[Any]:
+        """Return a copy of the PyTree, whose array leaves are NumPy arrays."""
+        with self.attach() as tree:
+            return _copy_arrays(tree)
+
+    def close(self):
+        """Destroy the segment."""
+        self._finalizer()
+
+    def transfer(self) -> SharedTreeHandle:
+        """Give up ownership of the segment, and return its handle.
+
+        The segment is not destroyed by this process. It should be received by
+        another process with `SharedTreeHandle.load(unlink=True)`, or
+        `SharedTreeHandle.claim()`. This is how workers return results.
+        """
+        self._finalizer.detach()
+        return self.handle
+
+    def __enter__(self) -> "SharedTree":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def tree_to_shared(
+    tree: PyTree[Any, "T"],
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+) -> SharedTree:
+    """Copy the array leaves of a PyTree into a single shared memory segment.
+
+    Processes that receive the returned `SharedTree.handle` can access the arrays as
+    zero-copy NumPy views, rather than each array being pickled and copied. JAX arrays
+    are transferred to the host first. Non-array leaves are kept in the handle, so they
+    must be picklable.
+
+    !!! Example "Process pools"
+        ```python
+        def work(handle):
+            with handle.attach() as tree:
+                result = expensive_numpy_op(tree)
+            # Return the result through shared memory as well.
+            return tree_to_shared(result).transfer()
+
+        with tree_to_shared(tree) as shared, ProcessPoolExecutor() as pool:
+            handles = pool.map(work, [shared.handle] * n_tasks)
+            results = [handle.load(unlink=True) for handle in handles]
+        ```
+
+    Arguments:
+        tree: The PyTree to share.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+
+    Returns:
+        A `SharedTree` that owns the segment. The segment is destroyed when it is
+        closed, so it must be kept open while other processes use its handle.
+    """
+    arrays, static = eqx.partition(tree, eqx.is_array, is_leaf=is_leaf)
+    leaves, treedef = jt.flatten(arrays)
+    leaves = [np.asarray(x) for x in jax.device_get(leaves)]
+
+    slots = []
+    offset = 0
+    for x in leaves:
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        slots.append(_ArraySlot(offset, x.shape, x.dtype.name))
+        offset += x.nbytes
+
+    # Segments cannot be empty.
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for x, slot in zip(leaves, slots):
+            view = np.ndarray(x.shape, dtype=x.dtype, buffer=shm.buf, offset=slot.offset)
+            view[...] = x
+            del view
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    _created_segments.add(shm.name)
+
+    handle = SharedTreeHandle(
+        name=shm.name,
+        nbytes=offset,
+        tree=eqx.combine(jt.unflatten(treedef, slots), static, is_leaf=is_leaf),
+    )
+    return SharedTree(shm, handle)
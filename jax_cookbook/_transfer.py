@@ -0,0 +1,162 @@
+"""Bulk transfers of PyTrees between devices and the host."""
+
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import logging
+import threading
+from typing import Any, Optional
+
+import jax
+import jax.tree as jt
+import jax.tree_util as jtu
+from jaxtyping import PyTree
+import numpy as np
+
+from ._tree import _path_to_label
+
+
+logger = logging.getLogger(__name__)
+
+# The default maximum number of threads that wait on the transfers of each tree.
+_DEFAULT_MAX_WORKERS = 8
+
+
+class HostTreeFuture:
+    """A handle to a PyTree whose array leaves are being copied to the host.
+
+    Returned by [`tree_to_host`][jax_cookbook.tree_to_host].
+    """
+
+    def __init__(
+        self,
+        tree: PyTree[Any, "T"],
+        callback: Optional[Callable[[str, np.ndarray], Any]],
+        join_with: str,
+        max_workers: Optional[int],
+        is_leaf: Optional[Callable[[Any], bool]],
+    ):
+        leaves_with_path, self._treedef = jtu.tree_flatten_with_path(tree, is_leaf=is_leaf)
+        self._leaves = [leaf for _, leaf in leaves_with_path]
+        self._labels = [_path_to_label(path, join_with) for path, _ in leaves_with_path]
+        self._pending = [
+            i for i, leaf in enumerate(self._leaves)
+            if isinstance(leaf, jax.Array) and not isinstance(leaf, jax.core.Tracer)
+        ]
+        self._callback = callback
+        self._max_workers = max_workers
+        self._future: Future = Future()
+        self._lock = threading.Lock()
+        self._started = False
+        self._retrieved = False
+
+        # Start all the transfers before waiting on any of them.
+        for i in self._pending:
+            self._leaves[i].copy_to_host_async()
+
+    def _start(self, background: bool):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if background:
+            threading.Thread(target=self._run, daemon=True).start()
+        else:
+            self._run()
+
+    def _run(self):
+        try:
+            leaves = list(self._leaves)
+            if self._pending:
+                max_workers = self._max_workers or min(
+                    len(self._pending), _DEFAULT_MAX_WORKERS
+                )
+                # `np.asarray` waits for both the computation of a leaf and its copy
+                # to the host, without holding the GIL; each waits in its own thread.
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {
+                        executor.submit(np.asarray, leaves[i]): i for i in self._pending
+                    }
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        leaves[i] = future.result()
+                        if self._callback is not None:
+                            self._callback(self._labels[i], leaves[i])
+            self._future.set_result(jt.unflatten(self._treedef, leaves))
+        except BaseException as e:
+            self._future.set_exception(e)
+
+    def done(self) -> bool:
+        """Return `True` if all the array leaves have been copied to the host."""
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> PyTree[Any, "T"]:
+        """Wait for the transfer to finish, and return the tree of NumPy arrays.
+
+        If the transfer was not started in the background, it is run in the calling
+        thread.
+        """
+        self._start(background=False)
+        self._retrieved = True
+        return self._future.result(timeout=timeout)
+
+    def __del__(self):
+        # Otherwise, errors raised in the background would pass silently.
+        if self._retrieved or not self._future.done():
+            return
+        exception = self._future.exception()
+        if exception is not None:
+            logger.error(
+                "Exception in a background `tree_to_host` transfer, whose result was "
+                "never retrieved",
+                exc_info=exception,
+            )
+
+
+def tree_to_host(
+    tree: PyTree[Any, "T"],
+    callback: Optional[Callable[[str, np.ndarray], Any]] = None,
+    background: bool = True,
+    join_with: str = '_',
+    max_workers: Optional[int] = None,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+) -> HostTreeFuture:
+    """Start copying all the JAX array leaves of a PyTree to the host, at once.
+
+    Calling `np.asarray` on each leaf in turn blocks on each transfer before starting
+    the next. Instead, this calls `copy_to_host_async` on every array leaf up front,
+    and returns a handle that resolves to a PyTree with the same structure, where JAX
+    arrays have been replaced by NumPy arrays. Non-array leaves (and NumPy arrays,
+    which are already on the host) are passed through unchanged.
+
+    !!! Example "Overlapping with training"
+        ```python
+        for step in range(n_steps):
+            model, opt_state, losses = train_step(model, opt_state, batch)
+            if step % save_every == 0:
+                # Returns immediately; the leaves are written to disk as they arrive,
+                # while the next training steps are dispatched.
+                tree_to_host(losses, callback=write_leaf)
+        ```
+
+    Arguments:
+        tree: The PyTree to transfer.
+        callback: An optional function that is called with the label (as with
+            `tree_labels`) and the NumPy array of each array leaf, as each leaf
+            arrives on the host. Leaves arrive roughly in the order that they are
+            computed and copied, though only up to `max_workers` of them are waited
+            on at once. Callbacks are called one at a time, from a single thread.
+        background: If `True`, leaves are collected (and passed to `callback`) in a
+            background thread, so that the calling thread can continue to dispatch
+            work to the device. If `False`, this happens when `result` is called.
+            Errors raised in the background (e.g. by `callback`) are raised by
+            `result`, or logged if the handle is discarded without calling it.
+        join_with: Passed to `tree_labels`, to form the labels passed to `callback`.
+        max_workers: The maximum number of threads that wait on the transfers.
+            Defaults to the number of array leaves, up to 8.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+    """
+    future = HostTreeFuture(tree, callback, join_with, max_workers, is_leaf)
+    if background:
+        future._start(background=True)
+    return future
@@ -1,11 +1,14 @@
-from collections import namedtuple
-from collections.abc import Callable, Sequence, Hashable
+from collections import OrderedDict, namedtuple
+from collections.abc import Callable, Hashable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 import functools
 import itertools
 import logging
+from operator import attrgetter
 import string
-from typing import Any, Optional, Tuple, TypeVar, Union
+import threading
+from typing import Any, Literal, Optional, Tuple, TypeVar, Union
 
 import equinox as eqx
 import jax
@@ -13,13 +16,14 @@ import jax.numpy as jnp
 import jax.random as jr
 import jax.tree as jt
 import jax.tree_util as jtu
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
 from jaxtyping import Array, ArrayLike, PRNGKeyArray, PyTree, PyTreeDef, Shaped
 import numpy as np
 
 from ._types import is_module
 from ._progress import _tqdm, _tqdm_write
-from .misc import unique_generator 
-from ._func import is_type 
+from .misc import prefetch_iterator, unique_generator
+from ._func import anyf, is_type 
 
 
 logger = logging.getLogger(__name__)
@@ -65,11 +69,18 @@ def filter_spec_leaves(
     return filter_spec
 
 
+@eqx.filter_jit
+def _ensemble_vmap(func, args, kwargs, keys):
+    # Defined once, so that calls with the same `func` and arguments reuse the trace.
+    return eqx.filter_vmap(lambda key: func(*args, **kwargs, key=key))(keys)
+
+
 def get_ensemble(
     func: Callable[..., PyTree[Any, "S"]],
     *args: Any,
     n_ensemble: int,
     key: PRNGKeyArray,
+    ensemble_mesh: Optional[Mesh] = None,
     **kwargs: Any,
 ) -> PyTree[Any, "S"]:
     """Vmap a function over a set of random keys.
@@ -81,11 +92,27 @@ def get_ensemble(
             dimensions in the array leaves of the returned PyTree.
         *args: The positional arguments to `func`.
         key: The key to split to perform the vmap.
+        ensemble_mesh: An optional device mesh. If given, the ensemble members are
+            split across the devices along the first axis of the mesh, and the array
+            leaves of the returned PyTree are sharded the same way. `n_ensemble` must
+            be divisible by the size of that axis. In this case `func` is also
+            JIT-compiled, so its non-array arguments must be hashable.
         **kwargs: The keyword arguments to `func`.
     """
     keys = jr.split(key, n_ensemble)
-    func_ = lambda key: func(*args, **kwargs, key=key)
-    return eqx.filter_vmap(func_)(keys)
+    if ensemble_mesh is None:
+        return eqx.filter_vmap(lambda key: func(*args, **kwargs, key=key))(keys)
+
+    axis_name = ensemble_mesh.axis_names[0]
+    n_shards = ensemble_mesh.shape[axis_name]
+    if n_ensemble % n_shards:
+        raise ValueError(
+            f"n_ensemble ({n_ensemble}) is not divisible by the size of mesh axis "
+            f"'{axis_name}' ({n_shards})"
+        )
+    keys = jax.device_put(keys, NamedSharding(ensemble_mesh, PartitionSpec(axis_name)))
+    # The output shardings are propagated from the sharded keys.
+    return _ensemble_vmap(func, args, kwargs, keys)
 
 
 @jax.named_scope("fbx.tree_take")
@@ -259,7 +286,53 @@ def _random_split_like_treedef(
     return jt.unflatten(treedef, keys)
 
 
-# TODO: Filter and combine non-array leaves
+_NUMERIC_SCALAR_TYPES = (bool, int, float, complex, np.generic)
+
+# Stacking many device arrays with a single `jnp.stack` compiles an XLA operation with
+# one operand per array, which is very slow for thousands of arrays.
+_STACK_CHUNK_SIZE = 64
+
+
+def _stack_leaves(leaves: Sequence[Any], axis: int) -> Any:
+    first = leaves[0]
+    if all(isinstance(x, (np.ndarray, *_NUMERIC_SCALAR_TYPES)) for x in leaves):
+        # Stack on the host, then move to the device in a single transfer.
+        return jax.device_put(np.stack(leaves, axis=axis))
+    if all(eqx.is_array(x) or isinstance(x, _NUMERIC_SCALAR_TYPES) for x in leaves):
+        if any(isinstance(x, jax.core.Tracer) for x in leaves):
+            return jnp.stack(leaves, axis=axis)
+        return _stack_chunked(leaves, axis)
+    if all(x is first or _static_leaves_equal(x, first) for x in leaves):
+        return first
+    raise ValueError(
+        "Non-array leaves of the PyTrees to be stacked must be equal; got "
+        f"{next(x for x in leaves if not _static_leaves_equal(x, first))!r} and {first!r}"
+    )
+
+
+def _stack_chunked(arrays: Sequence[Any], axis: int) -> Array:
+    chunk_size = _STACK_CHUNK_SIZE
+    if len(arrays) <= chunk_size:
+        return jnp.stack(arrays, axis=axis)
+    parts = [
+        jnp.stack(arrays[i : i + chunk_size], axis=axis)
+        for i in range(0, len(arrays), chunk_size)
+    ]
+    while len(parts) > chunk_size:
+        parts = [
+            jnp.concatenate(parts[i : i + chunk_size], axis=axis)
+            for i in range(0, len(parts), chunk_size)
+        ]
+    return jnp.concatenate(parts, axis=axis)
+
+
+def _static_leaves_equal(a: Any, b: Any) -> bool:
+    try:
+        return bool(a == b)
+    except Exception:
+        return a is b
+
+
 def tree_stack(
     trees: Sequence[PyTree[Array, "T"]],
     axis: int = 0,
@@ -275,12 +348,29 @@ def tree_stack(
         # [jnp.array([[1, 2], [5, 6]]), jnp.array([[3, 4], [7, 8]])]
         ```
 
+    Each tree is flattened once, so this is efficient even for thousands of trees.
+    Leaves that are NumPy arrays (or numeric scalars) in all of the trees are stacked
+    on the host, and moved to the device in a single transfer per leaf. Other
+    non-array leaves must be equal across all the trees, and are passed through
+    unchanged.
+
     Arguments:
         trees: A sequence of PyTrees with the same structure, and whose array
             leaves have the same shape.
         axis: The axis along which to stack the array leaves.
     """
-    return jt.map(lambda *v: jnp.stack(v, axis=axis), *trees)
+    if not trees:
+        raise ValueError("Cannot stack an empty sequence of PyTrees")
+    flat_trees = [jt.flatten(tree) for tree in trees]
+    treedef = flat_trees[0][1]
+    for _, other_treedef in flat_trees[1:]:
+        if other_treedef != treedef:
+            raise ValueError(
+                "All PyTrees to be stacked must have the same structure; "
+                f"got {treedef} and {other_treedef}"
+            )
+    columns = zip(*(leaves for leaves, _ in flat_trees))
+    return jt.unflatten(treedef, [_stack_leaves(column, axis) for column in columns])
 
 
 def tree_concatenate(
@@ -298,12 +388,21 @@ def tree_concatenate(
     return jt.map(lambda *v: jnp.concatenate(v, axis=axis), *trees)
 
 
+# The classes made by the factories below are interned, so that repeated calls with the
+# same arguments return the same class, and PyTrees built from them have equal treedefs.
+# Otherwise, `jit` caches and treedef-keyed caches would miss, and every call would
+# register another PyTree node type.
+
+
+@functools.cache
 def make_named_tuple_subclass(name):
     """Returns a trivial subclass of tuple with a different name.
 
     This is useful, for example, if we want a particular kind of tuple
     which we can select with `is_leaf`, but we don't want to define the fields
     of a `namedtuple`.
+
+    Calls with the same `name` return the same class.
     """
     def __repr__(self):
         return f"{name}{tuple.__repr__(self)}"
@@ -321,20 +420,31 @@ def make_named_tuple_subclass(name):
     return cls
 
 
+@functools.lru_cache(maxsize=256)
+def _dict_keys_with_path(keys: tuple[Hashable, ...]) -> tuple[jtu.DictKey, ...]:
+    return tuple(jtu.DictKey(k) for k in keys)
+
+
+@functools.cache
 def make_named_dict_subclass(name):
     """Returns a trivial subclass of dict with a different name.
 
     This is useful if we want a particular kind of dict that we can select with `is_leaf`.
+
+    Calls with the same `name` return the same class. Unlike the builtin `dict`,
+    the children are flattened in insertion order, not sorted by key.
     """
     def __repr__(self):
         return f"{name}({dict.__repr__(self)})"
 
     cls = type(name, (dict,), dict(__repr__=__repr__))
 
+    def dict_flatten(obj):
+        return tuple(obj.values()), tuple(obj)
+
     def dict_flatten_with_keys(obj):
-        children = [(jtu.DictKey(k), v) for k, v in obj.items()]
-        # return unzip2(sorted(x.items()))[::-1]
-        return (children, obj.keys())
+        keys = tuple(obj)
+        return tuple(zip(_dict_keys_with_path(keys), obj.values())), keys
 
     def dict_unflatten(keys, children):
         return cls(zip(keys, children))
@@ -343,11 +453,144 @@ def make_named_dict_subclass(name):
         cls,
         dict_flatten_with_keys,
         dict_unflatten,
+        flatten_func=dict_flatten,
+    )
+
+    return cls
+
+
+@functools.cache
+def _make_record_class(name: str, fields: tuple[str, ...]) -> type:
+    n_fields = len(fields)
+    path_keys = tuple(jtu.GetAttrKey(field) for field in fields)
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > n_fields:
+            raise TypeError(
+                f"{name} takes {n_fields} positional arguments but {len(args)} were given"
+            )
+        values = list(args)
+        for field in fields[len(args):]:
+            try:
+                values.append(kwargs.pop(field))
+            except KeyError:
+                raise TypeError(f"{name} missing argument: {field!r}") from None
+        if kwargs:
+            raise TypeError(f"{name} got unexpected arguments: {list(kwargs)}")
+        for setter, value in zip(setters, values):
+            setter(self, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Cannot set attribute {name!r} of a frozen record")
+
+    def __repr__(self):
+        items = ", ".join(f"{f}={v!r}" for f, v in zip(fields, flatten(self)[0]))
+        return f"{name}({items})"
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return flatten(self)[0] == flatten(other)[0]
+
+    def __hash__(self):
+        return hash(flatten(self)[0])
+
+    def _replace(self, **kwargs):
+        return cls(**{**dict(zip(fields, flatten(self)[0])), **kwargs})
+
+    def __reduce__(self):
+        # Used by `copy`, `copy.deepcopy` and `pickle`, which would otherwise set the
+        # slots with the frozen `__setattr__`; and which cannot find the class by name.
+        return _rebuild_record, (name, fields, flatten(self)[0])
+
+    cls = type(name, (), dict(
+        __slots__=fields,
+        __init__=__init__,
+        __setattr__=__setattr__,
+        __repr__=__repr__,
+        __eq__=__eq__,
+        __hash__=__hash__,
+        _fields=fields,
+        _replace=_replace,
+        __reduce__=__reduce__,
+    ))
+    # Slot descriptors set values directly, bypassing `__setattr__`.
+    setters = tuple(getattr(cls, field).__set__ for field in fields)
+
+    if n_fields == 0:
+        get_values = lambda obj: ()
+    elif n_fields == 1:
+        getter = attrgetter(fields[0])
+        get_values = lambda obj: (getter(obj),)
+    else:
+        get_values = attrgetter(*fields)
+
+    def flatten(obj):
+        return get_values(obj), None
+
+    def flatten_with_keys(obj):
+        return tuple(zip(path_keys, get_values(obj))), None
+
+    # As in `namedtuple`, generate the code of `unflatten` with the fields unrolled,
+    # which is faster than looping over the setters.
+    namespace = dict(_new=object.__new__, _cls=None)
+    namespace.update({f"_set_{i}": setter for i, setter in enumerate(setters)})
+    exec(
+        "def unflatten(aux_data, children):\n"
+        "    obj = _new(_cls)\n"
+        + "".join(f"    _set_{i}(obj, children[{i}])\n" for i in range(n_fields))
+        + "    return obj\n",
+        namespace,
     )
+    namespace["_cls"] = cls
+    unflatten = namespace["unflatten"]
 
+    jtu.register_pytree_with_keys(
+        cls, flatten_with_keys, unflatten, flatten_func=flatten,
+    )
     return cls
 
 
+def _rebuild_record(name: str, fields: tuple[str, ...], values: tuple) -> Any:
+    return _make_record_class(name, fields)(*values)
+
+
+def make_record_class(name: str, fields: Sequence[str]) -> type:
+    """Returns a slotted, frozen record class with fixed fields, registered as a PyTree node.
+
+    This is a lightweight alternative to an `eqx.Module`, for nodes that are flattened
+    and unflattened very often. Flattening reads the fields with a single
+    `operator.attrgetter`, and the key paths are precomputed. Unlike a `namedtuple`,
+    records are not sequences, so they are not equal to tuples, and cannot be indexed
+    or unpacked.
+
+    !!! Note ""
+        Records are several times faster to flatten and unflatten than modules, but
+        slower than a `namedtuple`, which JAX flattens natively; see
+        `benchmarks/flatten.py`.
+
+    Calls with the same `name` and `fields` return the same class. Records can be
+    copied, deep-copied and pickled; unpickling makes the class again if needed.
+
+    !!! Example
+        ```python
+        State = make_record_class("State", ("pos", "vel"))
+        state = State(pos=jnp.zeros(2), vel=jnp.ones(2))
+        state = jt.map(lambda x: x + 1, state)
+        state = state._replace(vel=jnp.zeros(2))
+        ```
+
+    Arguments:
+        name: The name of the class.
+        fields: The names of the fields of the class, which are its children as a
+            PyTree node, in order.
+    """
+    fields = tuple(fields)
+    if len(set(fields)) != len(fields):
+        raise ValueError(f"Duplicate field names: {fields}")
+    return _make_record_class(name, fields)
+
+
 def move_level_to_outside(tree, level_type):
     """Move a level with the given type to the outside of the tree.
 
@@ -448,6 +691,155 @@ def tree_sum_n_features(tree: PyTree[Array]) -> int:
     )
 
 
+def _accumulation_dtype(dtype) -> jnp.dtype:
+    # Accumulate low-precision and integer leaves in at least single precision.
+    if jnp.issubdtype(dtype, jnp.complexfloating):
+        return jnp.promote_types(dtype, jnp.complex64)
+    return jnp.promote_types(dtype, jnp.float32)
+
+
+def _leaf_sum_squares(x):
+    x = x.astype(_accumulation_dtype(x.dtype))
+    return jnp.sum(jnp.real(x * jnp.conj(x)))
+
+
+def _leaf_max_abs(x):
+    return jnp.max(jnp.abs(x.astype(_accumulation_dtype(x.dtype))), initial=0)
+
+
+def _leaf_n_nan(x):
+    if not jnp.issubdtype(x.dtype, jnp.inexact):
+        return jnp.zeros((), dtype=jnp.int32)
+    return jnp.sum(jnp.isnan(x), dtype=jnp.int32)
+
+
+def _leaf_n_inf(x):
+    if not jnp.issubdtype(x.dtype, jnp.inexact):
+        return jnp.zeros((), dtype=jnp.int32)
+    return jnp.sum(jnp.isinf(x), dtype=jnp.int32)
+
+
+def _leaf_sum(x):
+    return jnp.sum(x.astype(_accumulation_dtype(x.dtype)))
+
+
+# Maps the name of each statistic to a per-leaf reduction, and a reduction over leaves.
+_TREE_STATS: dict[str, Tuple[Callable[[Array], Array], Callable[[Array], Array]]] = dict(
+    sum_squares=(_leaf_sum_squares, jnp.sum),
+    max_abs=(_leaf_max_abs, jnp.max),
+    n_nan=(_leaf_n_nan, jnp.sum),
+    n_inf=(_leaf_n_inf, jnp.sum),
+    sum=(_leaf_sum, jnp.sum),
+)
+
+
+@partial(jax.jit, static_argnames=("stats", "per_leaf"))
+def _tree_reduce_stats_kernel(leaves, stats, per_leaf):
+    totals, leaf_values = {}, {}
+    for name in stats:
+        leaf_func, reduce_func = _TREE_STATS[name]
+        values = jnp.stack([leaf_func(x) for x in leaves])
+        totals[name] = reduce_func(values)
+        if per_leaf:
+            leaf_values[name] = values
+    return totals, leaf_values
+
+
+def tree_reduce_stats(
+    tree: PyTree[Any],
+    stats: Sequence[str] = ("sum_squares", "max_abs", "n_nan", "n_params"),
+    per_path: bool = False,
+    join_with: str = '_',
+    is_leaf: Optional[Callable[..., bool]] = None,
+) -> Union[dict[str, Any], Tuple[dict[str, Any], dict[str, dict[str, Any]]]]:
+    """Compute several summary statistics over all the array leaves of a PyTree.
+
+    All the statistics are computed by a single jitted kernel, rather than by one
+    `tree_map` and Python-level reduction per statistic, as in `tree_sum_squares`.
+    Floating-point leaves with less than single precision, and integer leaves, are
+    accumulated in (at least) single precision.
+
+    Available statistics are:
+
+    - `"sum_squares"`: The sum of the squares of all elements.
+    - `"max_abs"`: The maximum absolute value over all elements.
+    - `"n_nan"`: The number of NaN elements.
+    - `"n_inf"`: The number of infinite elements.
+    - `"sum"`: The sum of all elements.
+    - `"n_params"`: The total number of elements. This is computed from the leaf
+        shapes, without any device work.
+
+    !!! Example
+        ```python
+        stats = tree_reduce_stats(grads, ("sum_squares", "n_nan"))
+        grad_norm = jnp.sqrt(stats["sum_squares"])
+        ```
+
+    Arguments:
+        tree: The PyTree to summarize. Non-array leaves are ignored.
+        stats: The names of the statistics to compute.
+        per_path: If `True`, also return the statistics for each array leaf, in a dict
+            keyed by the labels returned by `tree_labels`. Raises a `ValueError` if
+            the labels of two leaves are the same.
+        join_with: Passed to `tree_labels`, when `per_path` is `True`.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+
+    Returns:
+        A dict from the names in `stats` to the corresponding statistic over all
+        array leaves. If `per_path` is `True`, a tuple of this dict and a dict from
+        leaf labels to dicts of per-leaf statistics.
+    """
+    stats = tuple(stats)
+    unknown = [name for name in stats if name != "n_params" and name not in _TREE_STATS]
+    if unknown:
+        raise ValueError(
+            f"Unknown statistics {unknown}; available statistics are "
+            f"{['n_params', *_TREE_STATS]}"
+        )
+
+    arrays = eqx.filter(tree, eqx.is_array, is_leaf=is_leaf)
+    leaves = jt.leaves(arrays)
+    kernel_stats = tuple(name for name in stats if name != "n_params")
+
+    if leaves and kernel_stats:
+        totals, leaf_values = _tree_reduce_stats_kernel(leaves, kernel_stats, per_path)
+    else:
+        # Zeros with the dtype each statistic has for single-precision leaves.
+        dtypes = {
+            name: jax.eval_shape(
+                _TREE_STATS[name][0], jax.ShapeDtypeStruct((0,), jnp.float32)
+            ).dtype
+            for name in kernel_stats
+        }
+        totals = {name: jnp.zeros((), dtypes[name]) for name in kernel_stats}
+        leaf_values = {name: jnp.zeros((0,), dtypes[name]) for name in kernel_stats}
+
+    if "n_params" in stats:
+        leaf_sizes = [x.size for x in leaves]
+        totals["n_params"] = sum(leaf_sizes)
+        leaf_values["n_params"] = leaf_sizes
+    totals = {name: totals[name] for name in stats}
+
+    if not per_path:
+        return totals
+
+    labels = jt.leaves(tree_labels(arrays, join_with=join_with)) if leaves else []
+    if len(set(labels)) != len(labels):
+        seen, duplicates = set(), set()
+        for label in labels:
+            (duplicates if label in seen else seen).add(label)
+        raise ValueError(
+            f"Leaves of the PyTree do not have unique labels: {sorted(duplicates)}; "
+            "try a different `join_with`"
+        )
+    by_path = {
+        label: {name: leaf_values[name][i] for name in stats}
+        for i, label in enumerate(labels)
+    }
+    return totals, by_path
+
+
 def _tree_map(
     f: Callable[..., Any],
     tree: PyTree[Any, "T"],
@@ -490,6 +882,156 @@ def tree_map_module(
     return jt.map(f, tree, *rest, is_leaf=is_module)
 
 
+def _filter_jit_vmap(f: Callable) -> Callable:
+    # Not cached here, which would keep `f` (and its closure) alive: equinox already
+    # reuses the compiled function for vmap wrappers of equal `f`.
+    return eqx.filter_jit(eqx.filter_vmap(f))
+
+
+def tree_map_vectorized(
+    f: Callable[[Any], S],
+    tree: PyTree[Any, "T"],
+    jit: bool = True,
+    return_n_vectorized: bool = False,
+) -> Union[PyTree[S, "T"], Tuple[PyTree[S, "T"], int]]:
+    """Like `tree_map_module`, but vectorizes over structurally identical modules.
+
+    `eqx.Module` leaves with the same structure, array shapes and dtypes, and non-array
+    leaves (e.g. an ensemble of models, or one model per condition) are stacked with
+    `tree_stack`, and `eqx.filter_vmap(f)` is applied once per group. The results are
+    unstacked back into place. Module leaves that do not share their structure with
+    any other module leaf, and all non-module leaves, are passed to `f` one at a time.
+
+    !!! Note ""
+        This assumes that `f` treats each module independently, and that it can be
+        vmapped -- e.g. it does not have Python side effects or branch on the values
+        of array leaves.
+
+    Arguments:
+        f: The function to map over the tree.
+        tree: The PyTree to map over.
+        jit: Whether to `eqx.filter_jit` the vmapped `f`. Equinox reuses the compiled
+            function for equal (e.g. the same) `f`, so repeated calls with the same
+            `f` and group signatures will not recompile.
+        return_n_vectorized: Whether to also return the number of module leaves that
+            were vectorized.
+    """
+    leaves, treedef = jt.flatten(tree, is_leaf=is_module)
+    module_idxs = [i for i, leaf in enumerate(leaves) if is_module(leaf)]
+    module_results, n_vectorized = _map_vectorized(
+        f,
+        [leaves[i] for i in module_idxs],
+        vmap_func=_filter_jit_vmap if jit else eqx.filter_vmap,
+    )
+    results = dict(zip(module_idxs, module_results))
+    results = [results[i] if i in results else f(leaf) for i, leaf in enumerate(leaves)]
+    logger.debug(
+        f"Vectorized {n_vectorized} of {len(module_idxs)} module leaves in "
+        "`tree_map_vectorized`"
+    )
+    mapped = jt.unflatten(treedef, results)
+    if return_n_vectorized:
+        return mapped, n_vectorized
+    return mapped
+
+
+def _stacked_chunks(
+    iterable: Iterable[PyTree[Any, "T"]],
+    chunk_size: int,
+) -> Iterator[Tuple[PyTree[Any, "T"], int]]:
+    """Yields `(stacked_chunk, n_valid)` for successive chunks of `iterable`.
+
+    The last chunk is padded to `chunk_size` by repeating its final tree, so that all
+    the chunks have the same shapes.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        n_valid = len(chunk)
+        chunk.extend([chunk[-1]] * (chunk_size - n_valid))
+        yield tree_stack(chunk), n_valid
+
+
+def tree_map_stream(
+    f: Callable[[PyTree[Any, "T"]], S],
+    iterable: Iterable[PyTree[Any, "T"]],
+    chunk_size: int,
+    prefetch: int = 2,
+    yield_chunks: bool = False,
+    jit: bool = True,
+) -> Iterator[S]:
+    """Apply a function to a stream of structurally identical PyTrees, in vectorized chunks.
+
+    Successive items of `iterable` are stacked with `tree_stack` into chunks of
+    `chunk_size`, and `eqx.filter_vmap(f)` is applied once per chunk. This avoids
+    both collecting the whole stream in memory, and calling `f` on one item at a
+    time. The last chunk is padded to the same size by repeating its final item, so
+    that it does not trigger a recompilation; the results for the padding are
+    discarded.
+
+    Chunks are assembled in a background thread, while earlier chunks are computed
+    on the device.
+
+    !!! Example
+        ```python
+        def trials():
+            for path in trial_paths:
+                yield load_trial(path)
+
+        for losses in tree_map_stream(eval_loss, trials(), chunk_size=256):
+            ...
+        ```
+
+    Arguments:
+        f: The function to apply to each item. It must be vmappable.
+        iterable: The PyTrees to map over. They must have the same structure, array
+            shapes and dtypes, and non-array leaves.
+        chunk_size: The number of items to process at once.
+        prefetch: The number of chunks to assemble in advance. If `0`, chunks are
+            assembled in the calling thread.
+        yield_chunks: If `True`, yield the stacked results of each chunk, whose array
+            leaves have a leading axis of size `chunk_size` (or less, for the last
+            chunk). If `False`, yield the result for each item in turn.
+        jit: Whether to `eqx.filter_jit` the vmapped `f`. Equinox reuses the compiled
+            function for equal (e.g. the same) `f`, so repeated calls with the same
+            `f` will not recompile.
+
+    Raises:
+        ValueError: If `chunk_size` is less than 1.
+    """
+    # Checked here rather than in the generator, so that it is raised immediately.
+    if chunk_size < 1:
+        raise ValueError(f"`chunk_size` must be at least 1, but is {chunk_size}")
+    return _tree_map_stream(f, iterable, chunk_size, prefetch, yield_chunks, jit)
+
+
+def _tree_map_stream(
+    f: Callable[[PyTree[Any, "T"]], S],
+    iterable: Iterable[PyTree[Any, "T"]],
+    chunk_size: int,
+    prefetch: int,
+    yield_chunks: bool,
+    jit: bool,
+) -> Iterator[S]:
+    func = _filter_jit_vmap(f) if jit else eqx.filter_vmap(f)
+    chunks = _stacked_chunks(iterable, chunk_size)
+    if prefetch > 0:
+        chunks = prefetch_iterator(chunks, size=prefetch)
+
+    for stacked, n_valid in chunks:
+        results = func(stacked)
+        if n_valid < chunk_size:
+            results = jt.map(
+                lambda x: x[:n_valid] if eqx.is_array(x) else x, results,
+            )
+        if yield_chunks:
+            yield results
+        else:
+            yield from tree_unstack(results)
+
+
 # Horizontal rule
 HR = u'\u2500' * 80
 
@@ -592,6 +1134,12 @@ def tree_zip(
     return jt.map(lambda *x: zip_cls(x), *trees, is_leaf=is_leaf)
 
 
+@functools.cache
+def _leaf_tuple_class(fields: tuple[str, ...]) -> type:
+    # Interned by fields, so that zipped trees have equal treedefs across calls.
+    return namedtuple("LeafTuple", fields)
+
+
 def tree_zip_named(
     is_leaf=None,
     **trees: PyTree[Any, "T"],
@@ -601,7 +1149,7 @@ def tree_zip_named(
     This is more convenient than `tree_zip` when we want to manipulate the zipped tuples
     as leaves, without worrying whether tuples appear elsewhere in the PyTree structure.
     """
-    LeafTuple = namedtuple("LeafTuple", trees.keys())
+    LeafTuple = _leaf_tuple_class(tuple(trees.keys()))
     zipped = jt.map(lambda *x: LeafTuple(*x), *trees.values(), is_leaf=is_leaf)
     return zipped, LeafTuple
 
@@ -625,11 +1173,83 @@ def _n_unique_strs(n):
     return itertools.islice(_character_generator(), n)
 
 
+def _stack_signature(tree: PyTree) -> Optional[Hashable]:
+    """Returns a key shared by PyTrees that can be stacked into a single PyTree.
+
+    Two PyTrees have the same key if their structures, array shapes and dtypes, and
+    non-array leaves all match. Returns `None` if `tree` has no array leaves, since
+    there would be nothing to stack.
+    """
+    arrays, static = eqx.partition(tree, eqx.is_array)
+    array_leaves, array_treedef = jt.flatten(arrays)
+    if not array_leaves:
+        return None
+    static_leaves, static_treedef = jt.flatten(static)
+    try:
+        static_key = tuple(static_leaves)
+        hash(static_key)
+    except TypeError:
+        static_key = tuple(map(id, static_leaves))
+    return (
+        array_treedef,
+        static_treedef,
+        tuple((x.shape, x.dtype) for x in array_leaves),
+        static_key,
+    )
+
+
+def _map_vectorized(
+    f: Callable[[Any], Any],
+    items: Sequence[Any],
+    vmap_func: Callable = eqx.filter_vmap,
+) -> Tuple[list, int]:
+    """Apply `f` to each of `items`, vectorizing over groups of stackable items.
+
+    Items with the same `_stack_signature` are stacked with `tree_stack`, passed
+    together to `vmap_func(f)`, and the results are unstacked. Items that do not
+    share their signature with any other item are passed to `f` one at a time.
+
+    Returns the list of results, and the number of items that were vectorized.
+    """
+    groups: dict[Hashable, list[int]] = {}
+    serial_idxs = []
+    for i, item in enumerate(items):
+        key = _stack_signature(item)
+        if key is None:
+            serial_idxs.append(i)
+        else:
+            groups.setdefault(key, []).append(i)
+
+    results: list = [None] * len(items)
+    n_vectorized = 0
+    f_v = vmap_func(f)
+    for idxs in groups.values():
+        if len(idxs) == 1:
+            serial_idxs.extend(idxs)
+            continue
+        group = [items[i] for i in idxs]
+        static = eqx.filter(group[0], eqx.is_array, inverse=True)
+        stacked = eqx.combine(
+            tree_stack([eqx.filter(item, eqx.is_array) for item in group]),
+            static,
+        )
+        for i, result in zip(idxs, tree_unstack(f_v(stacked))):
+            results[i] = result
+        n_vectorized += len(idxs)
+
+    for i in serial_idxs:
+        results[i] = f(items[i])
+
+    return results, n_vectorized
+
+
 def tree_call(
     tree: PyTree[Any, "T"],
     *args: Any,
     exclude: Callable = lambda _: False,
     is_leaf: Optional[Callable] = None,
+    parallel: Optional[Literal["vmap", "threads"]] = None,
+    max_workers: Optional[int] = None,
     **kwargs: Any,
 ) -> PyTree[Any, "T"]:
     """Returns a tree of the return values of a PyTree's callable leaves.
@@ -640,11 +1260,34 @@ def tree_call(
         Non-callable leaves, callable leaves that satisfy `exclude`, are passed through
         as-is.
 
+    !!! Example "Batched calls"
+        When the tree contains many callable PyTrees with the same structure, such as
+        `eqx.Module`s that only differ in their parameters, pass `parallel="vmap"`
+        so that they are called as a batch:
+
+        ```python
+        outputs = tree_call(models, x, is_leaf=is_module, parallel="vmap")
+        ```
+
+        This assumes that every callable leaf can be vmapped -- e.g. it does not have
+        Python side effects or branch on the values of its array leaves, or of the
+        arguments.
+
     Arguments:
         tree: Any PyTree.
         *args: Positional arguments to pass to each callable leaf.
         exclude: A function that returns `True` for any callable leaf that
             should not be called.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree.
+        parallel: How to call the callable leaves. If `None`, they are called one at a
+            time. If `"vmap"`, callable leaves with identical structures, array
+            shapes, and non-array leaves are stacked with `tree_stack`, and each group
+            is called once under `eqx.filter_vmap`, so they must be vmappable; the
+            rest are called one at a time.
+            If `"threads"`, they are called in a thread pool, which is useful when the
+            callables are heterogeneous and spend their time outside of Python.
+        max_workers: The maximum number of threads, when `parallel="threads"`.
         **kwargs: Keyword arguments to pass to each callable leaf.
     """
     callables, other_values = eqx.partition(
@@ -652,11 +1295,22 @@ def tree_call(
         lambda x: isinstance(x, Callable) and not exclude(x),
         is_leaf=is_leaf,
     )
-    callables_values = jt.map(
-        lambda x: x(*args, **kwargs),
-        callables,
-        is_leaf=is_leaf,
-    )
+    funcs, treedef = jt.flatten(callables, is_leaf=is_leaf)
+
+    def call(func):
+        return func(*args, **kwargs)
+
+    if parallel is None:
+        results = [call(func) for func in funcs]
+    elif parallel == "vmap":
+        results, _ = _map_vectorized(call, funcs)
+    elif parallel == "threads":
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(call, funcs))
+    else:
+        raise ValueError(f"Unknown value for `parallel`: {parallel!r}")
+
+    callables_values = jt.unflatten(treedef, results)
     return eqx.combine(callables_values, other_values, is_leaf=is_leaf)
 
 
@@ -710,6 +1364,24 @@ def _path_to_label(path: Sequence[BuiltInKeyEntry], join_with: str) -> str:
     return join_with.join(map(_node_key_to_label, path))
 
 
+def _flatten_one_level_with_keys(
+    node: PyTree,
+    is_leaf: Optional[Callable[..., bool]] = None,
+) -> Optional[Tuple[list[Tuple[BuiltInKeyEntry, Any]], PyTreeDef]]:
+    """Returns the `(key, child)` pairs of the top level of a PyTree node, and the
+    one-level structure of the node.
+
+    Returns `None` if `node` is a leaf. `None` and empty containers are nodes with no
+    children.
+    """
+    if is_leaf is not None and is_leaf(node):
+        return None
+    children, treedef = jtu.tree_flatten_with_path(node, is_leaf=lambda x: x is not node)
+    if len(children) == 1 and children[0][0] == ():
+        return None
+    return [(path[0], child) for path, child in children], treedef
+
+
 def tree_labels(
     tree: PyTree[Any, 'T'],
     join_with: str = '_',
@@ -910,4 +1582,109 @@ def leaves_of_type(leaf_type, tree):
             is_leaf=is_type(leaf_type),
         ),
         is_leaf=is_type(leaf_type),
-    )
\ No newline at end of file
+    )
+
+
+# Plans for `tree_partition_multi`, keyed by treedef, leaf types, and predicates.
+_PARTITION_PLAN_CACHE: OrderedDict[Hashable, Tuple[int, ...]] = OrderedDict()
+_PARTITION_PLAN_CACHE_SIZE = 256
+_PARTITION_PLAN_CACHE_LOCK = threading.Lock()
+
+
+def _leaf_type_key(leaf) -> Hashable:
+    """The type of a leaf, including the dtype and weak type of arrays."""
+    dtype = getattr(leaf, "dtype", None)
+    if dtype is None:
+        return type(leaf)
+    return type(leaf), dtype, getattr(leaf, "weak_type", False)
+
+
+def tree_partition_multi(
+    tree: PyTree[Any, "T"],
+    predicates: Mapping[str, Callable[[Any], bool]],
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+    cache_by_type: bool = False,
+) -> Tuple[dict[str, PyTree[Any, "T"]], PyTree[Any, "T"]]:
+    """Partition the leaves of a PyTree into several PyTrees, in a single pass.
+
+    This is like calling `eqx.partition` once for each predicate, except that the
+    tree is only flattened once, and each leaf is assigned to exactly one of the
+    returned PyTrees: that of the first predicate it satisfies, or the remainder.
+
+    !!! Example
+        ```python
+        parts, other = tree_partition_multi(
+            tree,
+            dict(arrays=eqx.is_array, modules=is_module, strs=is_type(str)),
+        )
+        tree == tree_combine_multi(parts, other)
+        ```
+
+    Arguments:
+        tree: The PyTree to partition.
+        predicates: A mapping from names to functions that return `True` for leaves
+            that belong in the named partition.
+        is_leaf: An optional function that decides whether each node in `tree`
+            should be treated as a leaf, or traversed as a subtree. Defaults to the
+            union of `predicates`, so that (for example) a subtree that is a module
+            is treated as a leaf when one of the predicates matches modules.
+        cache_by_type: If `True`, the assignment of leaves to partitions is cached on
+            the structure of `tree`, the types of its leaves (including the dtypes and
+            weak types of arrays), and the predicates. This is only correct if the
+            predicates depend on only these properties of leaves, and not on (e.g.)
+            their shapes or values. The predicates are compared by identity, so the
+            cache only helps if the same function objects are passed on each call
+            -- e.g. defined once at module level, rather than as inline lambdas.
+
+    Returns:
+        A tuple of 1) a dict from the names in `predicates` to PyTrees containing
+        only the matching leaves, with `None` elsewhere; and 2) a PyTree containing
+        the leaves that did not satisfy any of the predicates.
+    """
+    names = tuple(predicates)
+    funcs = tuple(predicates.values())
+    if is_leaf is None:
+        is_leaf = anyf(*funcs)
+    leaves, treedef = jt.flatten(tree, is_leaf=is_leaf)
+
+    def classify(leaf) -> int:
+        return next((i for i, func in enumerate(funcs) if func(leaf)), len(funcs))
+
+    if cache_by_type:
+        key = (treedef, tuple(map(_leaf_type_key, leaves)), funcs)
+        with _PARTITION_PLAN_CACHE_LOCK:
+            plan = _PARTITION_PLAN_CACHE.get(key)
+            if plan is not None:
+                _PARTITION_PLAN_CACHE.move_to_end(key)
+        if plan is None:
+            plan = tuple(map(classify, leaves))
+            with _PARTITION_PLAN_CACHE_LOCK:
+                _PARTITION_PLAN_CACHE[key] = plan
+                if len(_PARTITION_PLAN_CACHE) > _PARTITION_PLAN_CACHE_SIZE:
+                    _PARTITION_PLAN_CACHE.popitem(last=False)
+    else:
+        plan = tuple(map(classify, leaves))
+
+    parts = [
+        jt.unflatten(treedef, [leaf if j == i else None for leaf, j in zip(leaves, plan)])
+        for i in range(len(funcs) + 1)
+    ]
+    return dict(zip(names, parts[:-1])), parts[-1]
+
+
+def tree_combine_multi(
+    parts: Union[Mapping[str, PyTree[Any, "T"]], Sequence[PyTree[Any, "T"]]],
+    remainder: Optional[PyTree[Any, "T"]] = None,
+    is_leaf: Optional[Callable[[Any], bool]] = None,
+) -> PyTree[Any, "T"]:
+    """Combine the PyTrees returned by `tree_partition_multi`.
+
+    Arguments:
+        parts: The dict of partitioned PyTrees, or a sequence of PyTrees.
+        remainder: The PyTree of leaves that did not satisfy any predicate.
+        is_leaf: As for `eqx.combine`.
+    """
+    trees = list(parts.values()) if isinstance(parts, Mapping) else list(parts)
+    if remainder is not None:
+        trees.append(remainder)
+    return eqx.combine(*trees, is_leaf=is_leaf)
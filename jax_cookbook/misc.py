@@ -7,27 +7,48 @@
 from collections.abc import (
     Callable,
     Iterable,
+    Iterator,
     Mapping,
     MutableSequence,
     Sequence,
     Set,
 )
+import atexit
 import copy
 from itertools import zip_longest, chain
 import logging
+import queue
+import threading
 from typing import Any, Optional, Tuple, TypeVar, Union
-
-import jax.numpy as jnp
+import weakref
 
 
 logger = logging.getLogger(__name__)
 
 
-"""The signs of the i-th derivatives of cos and sin.
+def _sincos_grad_signs():
+    """The signs of the i-th derivatives of cos and sin.
 
-TODO: infinite cycle
-"""
-SINCOS_GRAD_SIGNS = jnp.array([(1, 1), (1, -1), (-1, -1), (-1, 1)])
+    TODO: infinite cycle
+    """
+    import jax.numpy as jnp
+
+    return jnp.array([(1, 1), (1, -1), (-1, -1), (-1, 1)])
+
+
+# Module-level constants that are only built on first access, so that importing this
+# module does not initialize a JAX backend.
+_LAZY_CONSTANTS = dict(
+    SINCOS_GRAD_SIGNS=_sincos_grad_signs,
+)
+
+
+def __getattr__(name: str):
+    if name in _LAZY_CONSTANTS:
+        value = _LAZY_CONSTANTS[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 T1 = TypeVar("T1")
@@ -98,10 +119,45 @@ def unique_generator(
             yield replace_value
 
 
+def _nested_dict_update_cow(dict_, update: Mapping, fresh: set[int]):
+    # Copy each dict the first time it is updated; dicts in `fresh` are already copies.
+    if id(dict_) not in fresh:
+        dict_ = copy.copy(dict_)
+        fresh.add(id(dict_))
+    for k, v in update.items():
+        if isinstance(v, Mapping):
+            sub = dict_.get(k)
+            if not isinstance(sub, Mapping):
+                sub = type(v)()
+                fresh.add(id(sub))
+            dict_[k] = _nested_dict_update_cow(sub, v, fresh)
+        else:
+            dict_[k] = v
+    return dict_
+
+
 def nested_dict_update(dict_, *args, make_copy: bool = True):
-    """Source: https://stackoverflow.com/a/3233356/23918276"""
+    """Recursively update a nested dict with the contents of one or more others.
+
+    Nested mappings in `args` are merged into the corresponding mappings of `dict_`;
+    all other values replace those in `dict_`.
+
+    If `make_copy` is `True`, `dict_` is not modified, and a new dict is returned even
+    if there are no updates. Only the dicts along the updated paths are copied; all
+    other subtrees and leaves (e.g. arrays) of the result are shared with `dict_`, so
+    they should not be modified in place. So, when building many configurations from
+    one base (e.g. for a hyperparameter sweep), the parts of the base that an update
+    does not touch are shared between all the results.
+
+    Source: https://stackoverflow.com/a/3233356/23918276
+    """
     if make_copy:
-        dict_ = copy.deepcopy(dict_)
+        if not args:
+            return copy.copy(dict_)
+        fresh: set[int] = set()
+        for arg in args:
+            dict_ = _nested_dict_update_cow(dict_, arg, fresh)
+        return dict_
     for arg in args:
         for k, v in arg.items():
             if isinstance(v, Mapping):
@@ -115,7 +171,73 @@ def nested_dict_update(dict_, *args, make_copy: bool = True):
     return dict_
 
 
+# Stop events and threads of active `prefetch_iterator`s, which are stopped at exit so
+# that they are not killed while in the middle of (e.g.) a device transfer.
+_prefetch_threads: "weakref.WeakKeyDictionary[threading.Thread, threading.Event]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@atexit.register
+def _stop_prefetch_threads():
+    for thread, stop in list(_prefetch_threads.items()):
+        stop.set()
+        thread.join(timeout=1.0)
 
 
+class _PrefetchDone:
+    pass
 
 
+class _PrefetchError:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def prefetch_iterator(iterable: Iterable[T1], size: int = 2) -> Iterator[T1]:
+    """Consume an iterable ahead of time in a background thread.
+
+    Up to `size` items are produced in advance and buffered in a bounded queue.
+    Exceptions raised by the iterable are re-raised by the returned iterator. The
+    background thread stops when the returned iterator is exhausted, closed, or
+    garbage collected.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_PrefetchDone())
+        except BaseException as e:
+            put(_PrefetchError(e))
+
+    def consume():
+        try:
+            while True:
+                item = buffer.get()
+                if isinstance(item, _PrefetchDone):
+                    return
+                if isinstance(item, _PrefetchError):
+                    raise item.exception
+                yield item
+        finally:
+            stop.set()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    _prefetch_threads[thread] = stop
+    thread.start()
+    iterator = consume()
+    weakref.finalize(iterator, stop.set)
+    return iterator
@@ -0,0 +1,55 @@
+import equinox as eqx
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from jax_cookbook import DeltaCheckpointer
+
+
+def make_tree():
+    return dict(
+        w=jnp.arange(6, dtype=jnp.float32).reshape(2, 3),
+        bf16=jnp.linspace(-1, 1, 5, dtype=jnp.bfloat16),
+        ints=np.arange(4, dtype=np.int8),
+        name="model",
+    )
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip(tmp_path, mmap):
+    tree = make_tree()
+    checkpointer = DeltaCheckpointer(tmp_path)
+    checkpointer.save(tree, step=0)
+    restored = checkpointer.restore(like=tree, mmap=mmap)
+
+    assert restored["name"] == "model"
+    for label in ("w", "bf16", "ints"):
+        assert restored[label].dtype == tree[label].dtype
+        np.testing.assert_array_equal(restored[label], np.asarray(tree[label]))
+
+
+def test_unchanged_leaves_are_not_rewritten(tmp_path):
+    tree = make_tree()
+    checkpointer = DeltaCheckpointer(tmp_path)
+    assert checkpointer.save(tree, step=0) > 0
+    assert checkpointer.save(tree, step=1) == 0
+
+    tree = eqx.tree_at(lambda t: t["w"], tree, tree["w"] + 1)
+    n_bytes = checkpointer.save(tree, step=2, where=lambda t: t["w"])
+    assert n_bytes == tree["w"].nbytes
+    np.testing.assert_array_equal(checkpointer.restore()["w"], np.asarray(tree["w"]))
+
+
+def test_gc(tmp_path):
+    checkpointer = DeltaCheckpointer(tmp_path)
+    for step in range(3):
+        checkpointer.save(dict(x=jnp.full(3, step)), step=step)
+    assert checkpointer.gc(keep=1) == 2
+    assert checkpointer.steps == [2]
+    np.testing.assert_array_equal(checkpointer.restore()["x"], np.full(3, 2))
+
+
+def test_duplicate_labels(tmp_path):
+    checkpointer = DeltaCheckpointer(tmp_path)
+    with pytest.raises(ValueError, match="unique labels"):
+        checkpointer.save({"a.b": jnp.zeros(1), "a": {"b": jnp.ones(1)}}, step=0)
@@ -0,0 +1,27 @@
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from jax_cookbook import CompressedTree
+
+
+@pytest.mark.parametrize("method", ["bf16", "fp16", "int8", "int8_block", "zlib"])
+def test_bfloat16_round_trip(method):
+    x = np.linspace(-1, 1, 48, dtype=np.float32).reshape(12, 4).astype(jnp.bfloat16)
+    compressed = CompressedTree({"x": x}, policy=method, block_rows=4)
+    assert compressed.report()["x"].method == method
+    out = compressed.decompress()["x"]
+    assert out.dtype == x.dtype
+    np.testing.assert_allclose(
+        out.astype(np.float32), x.astype(np.float32), atol=1e-2
+    )
+
+
+@pytest.mark.parametrize("method", ["none", "int8_block", "zlib"])
+def test_take_empty(method):
+    x = np.arange(24, dtype=np.float32).reshape(6, 4)
+    compressed = CompressedTree({"x": x}, policy=method, block_rows=4)
+    out = compressed.take([])["x"]
+    assert out.shape == (0, 4)
+    assert out.dtype == x.dtype
+    np.testing.assert_allclose(compressed.take([1, 5])["x"], x[[1, 5]], rtol=1e-2)
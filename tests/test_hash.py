@@ -0,0 +1,63 @@
+import jax.numpy as jnp
+import numpy as np
+
+from jax_cookbook import tree_dedupe, tree_fingerprint, tree_memoize
+
+
+def test_fingerprint_depends_on_contents_not_identity():
+    tree = dict(a=jnp.arange(3), b=np.ones(2), c="x")
+    copy = dict(a=jnp.arange(3), b=np.ones(2), c="x")
+    assert tree_fingerprint(tree) == tree_fingerprint(copy)
+    assert tree_fingerprint(tree) != tree_fingerprint(dict(tree, c="y"))
+    assert tree_fingerprint(tree) != tree_fingerprint(dict(tree, b=np.zeros(2)))
+
+
+def test_fingerprint_distinguishes_dtypes_of_the_same_bits():
+    # NumPy describes both dtypes as raw bytes (`'<V1'`).
+    bits = np.arange(4, dtype=np.uint8)
+    assert tree_fingerprint(jnp.asarray(bits.view(jnp.float8_e4m3fn))) != (
+        tree_fingerprint(jnp.asarray(bits.view(jnp.float8_e4m3fnuz)))
+    )
+    bf16 = jnp.asarray(np.arange(4, dtype=np.uint16).view(jnp.bfloat16))
+    assert tree_fingerprint(bf16) != tree_fingerprint(bf16.astype(jnp.float16))
+
+
+def test_memoize():
+    n_calls = 0
+
+    @tree_memoize(maxsize=2)
+    def total(tree):
+        nonlocal n_calls
+        n_calls += 1
+        return sum(x.sum() for x in tree)
+
+    assert total([np.ones(2), jnp.ones(3)]) == 5
+    assert total([np.ones(2), jnp.ones(3)]) == 5
+    assert n_calls == 1
+    total([np.ones(2), jnp.ones(3, dtype=jnp.bfloat16)])
+    assert n_calls == 2
+    assert total.cache_info().hits == 1
+
+
+def test_dedupe():
+    a, b = np.zeros(4), np.zeros(4)
+    x, y = jnp.arange(3.0), jnp.arange(3.0)
+    bits = np.arange(4, dtype=np.uint8)
+    fn, fnuz = bits.view(jnp.float8_e4m3fn), bits.copy().view(jnp.float8_e4m3fnuz)
+    tree = dict(a=a, b=b, x=x, y=y, z=jnp.arange(3.0) + 1, fn=fn, fnuz=fnuz)
+    deduped, info = tree_dedupe(tree, return_info=True)
+    assert deduped["b"] is deduped["a"]
+    assert deduped["y"] is deduped["x"]
+    assert deduped["z"] is not deduped["x"]
+    assert deduped["fnuz"] is not deduped["fn"]
+    assert info.n_duplicates == 2
+    assert info.bytes_saved == a.nbytes + x.nbytes
+
+
+def test_dedupe_fold_constants():
+    tree = dict(a=np.full((3, 4), 7.0), b=np.arange(3))
+    deduped, info = tree_dedupe(tree, fold_constants=True, return_info=True)
+    np.testing.assert_array_equal(deduped["a"], tree["a"])
+    assert deduped["a"].strides == (0, 0)
+    assert deduped["b"] is tree["b"]
+    assert info.n_folded == 1
@@ -0,0 +1,17 @@
+import jax
+import jax.numpy as jnp
+
+from jax_cookbook import plan_memory
+
+
+def test_plan_memory_peak_bytes_by_path():
+    def f(x):
+        return dict(outer=jnp.outer(x, x).sum(0), scaled=x * 2, name="static")
+
+    plan = plan_memory(f, jax.ShapeDtypeStruct((1000,), jnp.float32))
+    assert plan.output_bytes_by_path == {"outer": 4000, "scaled": 4000}
+    assert set(plan.peak_bytes_by_path) == {"outer", "scaled"}
+    # Only the outer product materializes a 1000 x 1000 intermediate.
+    assert plan.peak_bytes_by_path["outer"] >= 4_000_000
+    assert plan.peak_bytes_by_path["scaled"] < 10_000
+    assert plan.peak_bytes >= plan.peak_bytes_by_path["outer"]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from jax_cookbook.misc import nested_dict_update
+
+
+def make_config():
+    return dict(
+        model=dict(width=64, weights=np.zeros(3)),
+        data=dict(path="data", batch=dict(size=32)),
+    )
+
+
+def test_nested_dict_update_copy_on_write():
+    base = make_config()
+    result = nested_dict_update(base, dict(data=dict(batch=dict(size=64))))
+    assert result["data"]["batch"]["size"] == 64
+    assert result["data"]["path"] == "data"
+    assert base["data"]["batch"]["size"] == 32
+    # Only the dicts along the updated path are copied.
+    assert result is not base
+    assert result["data"] is not base["data"]
+    assert result["model"] is base["model"]
+
+
+def test_nested_dict_update_multiple_and_new_keys():
+    base = make_config()
+    result = nested_dict_update(
+        base, dict(model=dict(width=128)), dict(model=dict(depth=2), seed=0)
+    )
+    assert result["model"] == dict(width=128, weights=base["model"]["weights"], depth=2)
+    assert result["seed"] == 0
+    assert "depth" not in base["model"]
+
+
+def test_nested_dict_update_without_updates_copies():
+    base = make_config()
+    result = nested_dict_update(base)
+    assert result == base and result is not base
+    result["seed"] = 0
+    assert "seed" not in base
+
+
+def test_nested_dict_update_in_place():
+    base = make_config()
+    result = nested_dict_update(base, dict(data=dict(path="other")), make_copy=False)
+    assert result is base
+    assert base["data"]["path"] == "other"
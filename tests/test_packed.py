@@ -0,0 +1,63 @@
+import equinox as eqx
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from jax_cookbook import PackedTree, tree_pack, tree_unpack
+
+
+def make_tree():
+    return dict(
+        w=jnp.arange(6, dtype=jnp.float32).reshape(2, 3),
+        b=jnp.ones(3, dtype=jnp.float32),
+        bf16=jnp.ones((2, 2), dtype=jnp.bfloat16),
+        n=jnp.arange(4),
+        name="layer",
+    )
+
+
+def assert_trees_equal(tree, expected):
+    assert tree["name"] == expected["name"]
+    for label in ("w", "b", "bf16", "n"):
+        assert tree[label].dtype == expected[label].dtype
+        np.testing.assert_array_equal(tree[label], expected[label])
+
+
+def test_round_trip():
+    tree = make_tree()
+    packed = tree_pack(tree)
+    assert isinstance(packed, PackedTree)
+    assert packed.num_leaves == 4
+    assert sorted(packed.buffers) == ["bfloat16", "float32", "int32"]
+    assert packed.buffers["float32"].shape == (9,)
+    assert_trees_equal(tree_unpack(packed), tree)
+
+
+def test_round_trip_under_filter_jit():
+    tree = make_tree()
+    assert_trees_equal(eqx.filter_jit(tree_unpack)(tree_pack(tree)), tree)
+    assert_trees_equal(eqx.filter_jit(lambda t: tree_pack(t).unpack())(tree), tree)
+
+
+def test_map_and_reduce():
+    tree = make_tree()
+    packed = tree_pack(tree)
+    doubled = packed.map(lambda buf: buf * 2).unpack()
+    np.testing.assert_array_equal(doubled["w"], tree["w"] * 2)
+    summed = packed.map(jnp.add, packed).unpack()
+    np.testing.assert_array_equal(summed["n"], tree["n"] * 2)
+    assert packed.reduce(lambda buf: jnp.sum(buf.astype(jnp.float32))) == 28
+
+
+def test_map_rejects_other_layouts():
+    packed = tree_pack(make_tree())
+    other = tree_pack(dict(make_tree(), b=jnp.ones(4, dtype=jnp.float32)))
+    with pytest.raises(ValueError, match="layout"):
+        packed.map(jnp.add, other)
+
+
+def test_reduce_without_arrays():
+    packed = tree_pack(dict(name="static"))
+    with pytest.raises(ValueError, match="initializer"):
+        packed.reduce(jnp.sum)
+    assert packed.reduce(jnp.sum, initializer=0) == 0
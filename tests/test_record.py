@@ -0,0 +1,69 @@
+import copy
+import pickle
+
+import jax.numpy as jnp
+import jax.tree as jt
+import jax.tree_util as jtu
+import numpy as np
+import pytest
+
+from jax_cookbook import make_record_class
+
+
+State = make_record_class("State", ("pos", "vel"))
+
+
+def test_interned():
+    assert make_record_class("State", ["pos", "vel"]) is State
+    assert make_record_class("State", ("vel", "pos")) is not State
+
+
+def test_construct():
+    assert State(1, vel=2) == State(pos=1, vel=2)
+    assert repr(State(1, 2)) == "State(pos=1, vel=2)"
+    with pytest.raises(TypeError):
+        State(1)
+    with pytest.raises(TypeError):
+        State(1, 2, 3)
+    with pytest.raises(TypeError):
+        State(1, 2, acc=3)
+    with pytest.raises(ValueError):
+        make_record_class("Bad", ("a", "a"))
+
+
+def test_frozen_and_replace():
+    state = State(1, 2)
+    with pytest.raises(AttributeError):
+        state.pos = 3
+    assert state._replace(vel=3) == State(1, 3)
+    assert state == State(1, 2)
+
+
+def test_hash():
+    assert hash(State(1, 2)) == hash(State(1, 2))
+    assert len({State(1, 2), State(1, 2), State(2, 1)}) == 2
+    assert State(1, 2) != (1, 2)
+
+
+def test_pytree_round_trip():
+    state = State(jnp.zeros(2), jnp.ones(2))
+    leaves, treedef = jt.flatten(state)
+    assert len(leaves) == 2
+    restored = jt.unflatten(treedef, leaves)
+    assert type(restored) is State
+    mapped = jt.map(lambda x: x + 1, state)
+    np.testing.assert_array_equal(mapped.pos, np.ones(2))
+    paths = [path for path, _ in jtu.tree_flatten_with_path(state)[0]]
+    assert paths == [(jtu.GetAttrKey("pos"),), (jtu.GetAttrKey("vel"),)]
+
+
+@pytest.mark.parametrize(
+    "copy_func",
+    [copy.copy, copy.deepcopy, lambda x: pickle.loads(pickle.dumps(x))],
+)
+def test_copy_and_pickle(copy_func):
+    state = State(np.arange(3), [1, 2])
+    copied = copy_func(state)
+    assert type(copied) is State
+    np.testing.assert_array_equal(copied.pos, state.pos)
+    assert copied.vel == state.vel
@@ -0,0 +1,57 @@
+import gc
+import pickle
+
+import jax.numpy as jnp
+import numpy as np
+
+from jax_cookbook import tree_to_shared
+
+
+def make_tree():
+    return dict(
+        w=jnp.arange(6, dtype=jnp.float32).reshape(2, 3),
+        bf16=jnp.linspace(-1, 1, 5, dtype=jnp.bfloat16),
+        f8=jnp.arange(4, dtype=jnp.float8_e4m3fn),
+        empty=np.zeros((0, 2)),
+        name="data",
+    )
+
+
+def assert_trees_equal(tree, expected):
+    assert tree["name"] == expected["name"]
+    for label in ("w", "bf16", "f8", "empty"):
+        assert tree[label].dtype == expected[label].dtype
+        assert tree[label].shape == expected[label].shape
+        np.testing.assert_array_equal(
+            tree[label].astype(np.float32), np.asarray(expected[label], np.float32)
+        )
+
+
+def test_load_and_attach():
+    tree = make_tree()
+    with tree_to_shared(tree) as shared:
+        handle = pickle.loads(pickle.dumps(shared.handle))
+        assert_trees_equal(handle.load(), tree)
+        with handle.attach() as views:
+            assert_trees_equal(views, tree)
+            views["w"][0, 0] = 100
+        assert shared.load()["w"][0, 0] == 100
+
+
+def test_views_outlive_attach_and_close():
+    shared = tree_to_shared(make_tree())
+    with shared.handle.attach() as views:
+        w = views["w"]
+    shared.close()
+    del shared, views
+    gc.collect()
+    np.testing.assert_array_equal(w, np.arange(6, dtype=np.float32).reshape(2, 3))
+
+
+def test_transfer_and_claim():
+    tree = make_tree()
+    handle = tree_to_shared(tree).transfer()
+    with handle.claim() as shared:
+        assert_trees_equal(shared.load(), tree)
+    handle = tree_to_shared(tree).transfer()
+    assert_trees_equal(handle.load(unlink=True), tree)